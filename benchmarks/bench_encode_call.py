@@ -0,0 +1,43 @@
+"""对比 ERC20 approve calldata 的两种编码方式
+
+    python benchmarks/bench_encode_call.py [次数]
+
+before: 每次读取 abi、构造合约对象并 encodeABI(优化前的做法)
+after:  contracts.encode_call 使用预计算的函数选择器直接编码
+"""
+import json
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from web3 import Web3
+
+from create_account.contracts import ROOT_PATH, encode_call
+
+TOKEN = "0x705931A83C9b22fB29985f28Aee3337Aa10EFE11"
+SPENDER = "0x25108c0d83Ee16b81f63B49F0F37933cFC8ea0b2"
+AMOUNT = 10**18
+
+
+def before(web3):
+    with open(f"{ROOT_PATH}/abis/ERC20.json") as file:
+        abi = json.load(file)
+    return web3.eth.contract(address=TOKEN, abi=abi).encodeABI(fn_name="approve", args=[SPENDER, AMOUNT])
+
+
+def after():
+    return encode_call("approve", SPENDER, AMOUNT)
+
+
+def main(number):
+    web3 = Web3()
+    assert before(web3) == after()
+    for name, fn in (("before", lambda: before(web3)), ("after", after)):
+        seconds = timeit.timeit(fn, number=number)
+        print(f"{name}: {seconds / number * 1000:.3f} ms per call")
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 1000)
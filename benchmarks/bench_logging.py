@@ -0,0 +1,42 @@
+"""测量每笔交易一条 debug 日志的开销
+
+    python benchmarks/bench_logging.py [次数]
+
+filtered: 未开启 debug, 日志级别被过滤
+sync:     开启 debug, 在调用线程中格式化并写入日志文件
+queued:   开启 debug 和'use_queue', 调用方只入队, 格式化和文件 IO 在后台线程进行;
+          后台线程与调用方竞争 GIL, 另外输出包含写完队列的总耗时
+"""
+import os
+import sys
+import tempfile
+import time
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from create_account.logger import Logger
+
+TX_HASH = "0x" + "ab" * 32
+TX = {'from': "0x145F356161c7F698f13d7d4C9f4395176a4fC4AA", 'to': "0x705931A83C9b22fB29985f28Aee3337Aa10EFE11", 'nonce': 7, 'gas': 60000}
+
+
+def log(logger):
+    logger.debug("MultiSend hash: %s, tx: %s", TX_HASH, TX, extra={'tx_hash': TX_HASH, 'phase': "transfer"})
+
+
+def main(number):
+    with tempfile.TemporaryDirectory() as path:
+        os.chdir(path)
+        os.mkdir("logs")
+        for name, options in (("filtered", {}), ("sync", {'debug': True}), ("queued", {'debug': True, 'use_queue': True})):
+            logger = Logger(f"bench_{name}", screen=False, **options)
+            start = time.perf_counter()
+            seconds = timeit.timeit(lambda: log(logger), number=number)
+            logger.close()
+            total = time.perf_counter() - start
+            print(f"{name}: {seconds / number * 1000000:.2f} us per call, {total / number * 1000000:.2f} us including flush")
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 100000)
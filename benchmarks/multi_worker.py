@@ -0,0 +1,113 @@
+"""多个进程共用一个 mongod 并行分发, 检查每个账户只分发一次、没有交易因 nonce 冲突被拒绝, 并对比吞吐
+
+    python benchmarks/multi_worker.py mongodb://localhost:27017/ [进程数] [账户数]
+
+链由 tests/stub_rpc.py 的本地桩节点模拟(交易立即上链, 重复或跳跃的 nonce 被拒绝);
+开启'work_lease', 每个进程租用一个资金钱包, 依次以 1 个进程和指定进程数各运行一次
+"""
+import multiprocessing
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+import mongoengine
+from eth_account import Account
+
+from create_account.database.keys import Keys
+from create_account.server import Server
+from tests.stub_rpc import StubChain, StubRPCServer
+
+DB = "account_db_multi_worker"
+TOKEN = "0x705931A83C9b22fB29985f28Aee3337Aa10EFE11"
+
+
+def wallets(count):
+    keys = ["0x" + format(i + 1, "064x") for i in range(count)]
+    return [{'address': Account.from_key(key).address, 'key': key} for key in keys]
+
+
+def make_config(uri, mongo, count, funding_wallets, owner):
+    return {
+        "chain_rpc": uri,
+        "account_count": count,
+        "per_request": 200,
+        "post_interval": 0,
+        "staking_interval": 0,
+        "staking_symbol": "PNUT",
+        "work_lease": True,
+        "lease_owner": owner,
+        "funding_wallets": funding_wallets,
+        "main_account": funding_wallets[0]['address'],
+        "main_account_key": funding_wallets[0]['key'],
+        "contracts": {
+            "MultiSend": "0xa0613b63C30758485A2ecd3382Cd253707419bd7",
+            "ERC20Staking": "0x25108c0d83Ee16b81f63B49F0F37933cFC8ea0b2"
+        },
+        "fees": {
+            "fee_transfer": 105000000000000,
+            "gas_price": 5000000000,
+            "gas_transfer": 21000,
+            "gas_approve": 44284,
+            "gas_deposit": 234482
+        },
+        "distribute": [{
+            "symbol": "BNB",
+            "amount": 0.0013,
+            "address": ""
+        }, {
+            "symbol": "PNUT",
+            "amount": [3, 10],
+            "address": TOKEN
+        }],
+        "mongo": {
+            "host": mongo,
+            "db": DB
+        }
+    }
+
+
+def worker(config):
+    Server(config).run_transfer()
+
+
+def run(mongo, workers, count):
+    funding_wallets = wallets(workers)
+    chain = StubChain(auto_mine=True)
+    for wallet in funding_wallets:
+        chain.balances[wallet['address'].lower()] = 10**24
+        chain.tokens[wallet['address'].lower()] = 10**30
+        chain.allowances[wallet['address'].lower()] = 2**256 - 1
+    db = mongoengine.connect(db=DB, host=mongo)
+    db.drop_database(DB)
+    Keys._get_collection().insert_many([{
+        "_id": i,
+        "address": f"0x{i:040x}",
+        "isTransfer": 0,
+        "transferred": [],
+        "isMortgage": False
+    } for i in range(1, count + 1)])
+    with StubRPCServer(chain) as stub:
+        context = multiprocessing.get_context("spawn")
+        processes = [context.Process(target=worker, args=(make_config(stub.uri, mongo, count, funding_wallets, f"worker-{i}"), )) for i in range(workers)]
+        start = time.monotonic()
+        for process in processes:
+            process.start()
+        for process in processes:
+            process.join()
+        seconds = time.monotonic() - start
+    done = Keys.objects(transferred__all=["BNB", "PNUT"], isTransfer=2).count()
+    print(f"{workers} workers: {done}/{count} accounts, {len(chain.sent)} transactions, {len(chain.rejected)} rejected, "
+          f"{seconds:.1f}s, {done / seconds:.0f} accounts/s")
+    db.drop_database(DB)
+    mongoengine.disconnect()
+    return done == count and not chain.rejected
+
+
+if __name__ == '__main__':
+    mongo = sys.argv[1]
+    workers = int(sys.argv[2]) if len(sys.argv) > 2 else 4
+    count = int(sys.argv[3]) if len(sys.argv) > 3 else 20000
+    ok = all([run(mongo, 1, count), run(mongo, workers, count)])
+    sys.exit(0 if ok else 1)
@@ -0,0 +1,157 @@
+import json
+
+from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo.errors import DuplicateKeyError
+from web3 import AsyncHTTPProvider, Web3
+from web3._utils.request import async_make_post_request
+from web3.eth import AsyncEth
+from web3.middleware import async_geth_poa_middleware
+
+from create_account.database.keys import Keys
+from create_account.database.lease import Lease
+from create_account.database.plan import Plan
+from create_account.provider import AsyncPooledHTTPProvider
+from create_account.server import Server
+
+
+class AsyncServer(Server):
+    """使用异步 HTTP provider 和 motor 的执行引擎, 多个账户的 RPC 调用和回执可在同一事件循环中并发等待
+
+    交易的构造与签名仍复用 Server 中的同步 web3 对象(不产生网络请求), 仅覆盖 IO 原语
+    """
+
+    def __init__(self, config, debug=False) -> None:
+        super().__init__(config, debug)
+        if self.config.get('chain_rpcs'):
+            provider = AsyncPooledHTTPProvider(self.config['chain_rpcs'], self.config.get('rpc_broadcast', 2))
+        else:
+            provider = AsyncHTTPProvider(self.config['chain_rpc'])
+        self.async_web3 = Web3(provider, modules={'eth': (AsyncEth, )}, middlewares=[])
+        self.async_web3.middleware_onion.inject(async_geth_poa_middleware, layer=0)
+        self.motor = AsyncIOMotorClient(self.config['mongo']['host'])
+        self.keys = self.motor[self.config['mongo']['db']][Keys._get_collection_name()]
+        self.plans = self.motor[self.config['mongo']['db']][Plan._get_collection_name()]
+        self.leases = self.motor[self.config['mongo']['db']][Lease._get_collection_name()]
+
+    async def _with_leases(self, coro):
+        """运行结束后关闭连接池中各节点的 aiohttp session"""
+        try:
+            return await super()._with_leases(coro)
+        finally:
+            if isinstance(self.async_web3.provider, AsyncPooledHTTPProvider):
+                await self.async_web3.provider.close()
+
+    async def _call(self, to, data):
+        return await self.async_web3.eth.call({'to': to, 'data': data})
+
+    async def _get_balance(self, address):
+        return await self.async_web3.eth.get_balance(address)
+
+    async def _get_nonce(self, address):
+        return await self.async_web3.eth.get_transaction_count(address, "pending")
+
+    async def _get_gas_price(self):
+        return await self.async_web3.eth.gas_price
+
+    async def _get_chain_id(self):
+        return await self.async_web3.eth.chain_id
+
+    async def _estimate_gas(self, tx):
+        return await self.async_web3.eth.estimate_gas(tx)
+
+    async def _get_block_gas_limit(self):
+        return (await self.async_web3.eth.get_block("latest"))['gasLimit']
+
+    async def _send_raw(self, raw_tx):
+        return self.web3.toHex(await self.async_web3.eth.send_raw_transaction(raw_tx))
+
+    async def _poll_receipt(self, tx_hash):
+        return await self.async_web3.eth.wait_for_transaction_receipt(tx_hash)
+
+    async def _post_batch(self, payload):
+        provider = self.async_web3.provider
+        data = json.dumps(payload).encode()
+        if isinstance(provider, AsyncPooledHTTPProvider):
+            return json.loads(await provider.post(data))
+        return json.loads(await async_make_post_request(provider.endpoint_uri, data, **dict(provider.get_request_kwargs())))
+
+    async def _find(self, query, fields, after_id, limit):
+        query = {**query, '_id': {**query.get('_id', {}), '$gt': after_id}}
+        cursor = self.keys.find(query, {field: 1 for field in fields}).sort('_id', 1).limit(limit)
+        return [Keys._from_son(doc) for doc in await cursor.to_list(None)]
+
+    async def _find_transfer_accounts(self, symbol, after_id, limit, shard=None):
+        query = {'transferred': {'$ne': symbol}}
+        if shard:
+            query['_id'] = {'$mod': list(shard)}
+        return await self._find(query, ('address', ), after_id, limit)
+
+    async def _count_transfer_accounts(self, symbol, shard=None):
+        query = {'transferred': {'$ne': symbol}}
+        if shard:
+            query['_id'] = {'$mod': list(shard)}
+        return await self.keys.count_documents(query)
+
+    async def _find_staking_accounts(self, coin_count, after_id, limit):
+        return await self._find({'isTransfer': coin_count, 'isMortgage': False}, self.key_fields, after_id, limit)
+
+    async def _find_sweep_accounts(self, after_id, limit):
+        return await self._find({'isMortgage': True}, self.key_fields, after_id, limit)
+
+    async def _find_transferred(self, ids, symbol):
+        return {doc['_id'] async for doc in self.keys.find({'_id': {'$in': ids}, 'transferred': symbol}, {'_id': 1})}
+
+    async def _insert_plan(self, docs):
+        return await self.plans.insert_many(docs, ordered=False)
+
+    async def _count_plan(self, wallet):
+        return await self.plans.count_documents({'wallet': wallet, 'status': "pending"})
+
+    async def _find_plan(self, wallet, symbol, after_batch, limit):
+        cursor = self.plans.find({'wallet': wallet, 'symbol': symbol, 'status': "pending", 'batch': {'$gt': after_batch}}).sort('batch', 1).limit(limit)
+        return [Plan._from_son(doc) for doc in await cursor.to_list(None)]
+
+    async def _finish_plan(self, wallet, symbol):
+        return await self.plans.update_many({'wallet': wallet, 'symbol': symbol, 'status': "pending"}, {'$set': {'status': "done"}})
+
+    async def _claim(self, ids, lease, query):
+        claimable, update, mine = self._lease_queries(ids, lease, query)
+        await self.keys.update_many(claimable, update)
+        return {doc['_id'] async for doc in self.keys.find(mine, {'_id': 1})}
+
+    async def _release(self, ids, lease):
+        field = f"leases.{lease}"
+        return await self.keys.update_many({'_id': {'$in': ids}, f"{field}.owner": self.lease_owner}, {'$unset': {field: ""}})
+
+    async def _claim_resource(self, name):
+        claimable, update = self._resource_queries(name)
+        try:
+            await self.leases.update_one(claimable, update, upsert=True)
+        except DuplicateKeyError:
+            return False
+        return True
+
+    async def _release_resources(self, names):
+        return await self.leases.delete_many({'_id': {'$in': names}, 'owner': self.lease_owner})
+
+    async def _renew(self, ids, lease):
+        field = f"leases.{lease}"
+        return await self.keys.update_many({'_id': {'$in': ids}, f"{field}.owner": self.lease_owner}, {'$set': {f"{field}.expires": self._expires()}})
+
+    async def _renew_resources(self, names):
+        return await self.leases.update_many({'_id': {'$in': names}, 'owner': self.lease_owner}, {'$set': {'expires': self._expires()}})
+
+    async def _find_account(self, id):
+        doc = await self.keys.find_one({'_id': id}, {'address': 1})
+        return Keys._from_son(doc) if doc else None
+
+    async def _update_accounts(self, ids, **fields):
+        return await self.keys.update_many({'_id': {'$in': ids}}, {'$set': fields})
+
+    async def _mark_transferred(self, ids, symbol):
+        query = {'_id': {'$in': ids}, 'transferred': {'$ne': symbol}}
+        return await self.keys.update_many(query, {'$addToSet': {'transferred': symbol}, '$inc': {'isTransfer': 1}})
+
+    async def _migrate_transfer_progress(self, symbols):
+        for count in range(1, len(symbols) + 1):
+            await self.keys.update_many({'transferred': {'$exists': False}, 'isTransfer': count}, {'$set': {'transferred': symbols[:count]}})
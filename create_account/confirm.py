@@ -0,0 +1,133 @@
+import asyncio
+import time
+
+
+class ConfirmationTracker:
+    """跟随新区块确认交易, 代替每笔交易单独轮询回执
+
+    后台任务每个出块间隔读取一次新区块, 将区块内的交易哈希与待确认集合匹配,
+    达到'depth'个确认后批量读取回执并统一唤醒所有等待者; 超过'timeout'仍未匹配的交易单独核对回执。
+    读取节点出错时按指数退避重试(最长'max_backoff'秒), 期间只让超过'timeout'的交易失败
+    """
+
+    def __init__(self, reader, depth=0, timeout=120, poll_interval=3, max_backoff=30) -> None:
+        self.reader = reader
+        self.depth = depth
+        self.timeout = timeout
+        self.poll_interval = poll_interval
+        self.max_backoff = max_backoff
+        self.errors = 0
+        self.head = None
+        self.pending = {}
+        self._block_waiters = []
+        self._fresh = set()
+        self._next_block = None
+        self._task = None
+
+    def add(self, tx_hash, callback=None):
+        """登记待确认交易, 返回在确认后得到回执的 future"""
+        tx_hash = tx_hash.lower()
+        if tx_hash not in self.pending:
+            future = asyncio.get_running_loop().create_future()
+            self.pending[tx_hash] = {'future': future, 'since': time.monotonic(), 'block': None}
+            self._fresh.add(tx_hash)
+        future = self.pending[tx_hash]['future']
+        if callback:
+            future.add_done_callback(callback)
+        self._start()
+        return future
+
+    def _start(self):
+        if self._task is None or self._task.done():
+            self._task = asyncio.ensure_future(self._follow())
+
+    async def wait(self, tx_hash):
+        return await self.add(tx_hash)
+
+    def discard(self, tx_hash):
+        """不再等待该交易, 例如同一 nonce 的其他版本已经上链"""
+        tx_hash = tx_hash.lower()
+        self._fresh.discard(tx_hash)
+        entry = self.pending.pop(tx_hash, None)
+        if entry:
+            entry['future'].cancel()
+
+    def next_block(self):
+        """返回读到更高区块时得到区块号的 future, 需有待确认交易时才会推进"""
+        future = asyncio.get_running_loop().create_future()
+        self._block_waiters.append(future)
+        self._start()
+        return future
+
+    async def _follow(self):
+        while self.pending:
+            try:
+                await self._poll()
+                self.errors = 0
+            except Exception as e:
+                # 节点暂时不可用时交易仍可能上链, 不能让所有等待者一起失败
+                self.errors += 1
+                self._fail_expired(e)
+                if self.pending:
+                    await asyncio.sleep(min(self.poll_interval * 2**self.errors, self.max_backoff))
+                continue
+            if self.pending:
+                await asyncio.sleep(self.poll_interval)
+        # 空闲后重新从最新区块开始跟随, 不回溯空闲期间的区块
+        self._next_block = None
+        waiters, self._block_waiters = self._block_waiters, []
+        for future in waiters:
+            future.cancel()
+
+    def _fail_expired(self, error):
+        now = time.monotonic()
+        for tx_hash in [h for h, entry in self.pending.items() if now - entry['since'] > self.timeout]:
+            entry = self.pending.pop(tx_hash)
+            if not entry['future'].done():
+                entry['future'].set_exception(Exception(f"Transaction {tx_hash} is not in the chain after {self.timeout} seconds: {error}"))
+
+    async def _mark_mined(self, tx_hashes):
+        tx_hashes = list(tx_hashes)
+        for tx_hash, receipt in zip(tx_hashes, await self.reader.receipts(tx_hashes)):
+            if receipt and tx_hash in self.pending:
+                self.pending[tx_hash]['block'] = receipt['blockNumber']
+
+    async def _poll(self):
+        head = await self.reader.block_number()
+        if self.head is None or head > self.head:
+            self.head = head
+            waiters, self._block_waiters = self._block_waiters, []
+            for future in waiters:
+                if not future.done():
+                    future.set_result(head)
+        # 登记前可能已经上链的交易直接核对一次回执
+        if self._fresh:
+            fresh, self._fresh = self._fresh, set()
+            await self._mark_mined(fresh)
+        if self._next_block is None:
+            self._next_block = head
+        if head >= self._next_block:
+            numbers = list(range(self._next_block, head + 1))
+            for number, tx_hashes in zip(numbers, await self.reader.block_transactions(numbers)):
+                for tx_hash in tx_hashes:
+                    if tx_hash in self.pending and self.pending[tx_hash]['block'] is None:
+                        self.pending[tx_hash]['block'] = number
+            self._next_block = head + 1
+        now = time.monotonic()
+        expired = [h for h, entry in self.pending.items() if entry['block'] is None and now - entry['since'] > self.timeout]
+        if expired:
+            await self._mark_mined(expired)
+            for tx_hash in expired:
+                if self.pending[tx_hash]['block'] is None:
+                    entry = self.pending.pop(tx_hash)
+                    entry['future'].set_exception(Exception(f"Transaction {tx_hash} is not in the chain after {self.timeout} seconds"))
+        ready = [h for h, entry in self.pending.items() if entry['block'] is not None and head >= entry['block'] + self.depth]
+        if ready:
+            for tx_hash, receipt in zip(ready, await self.reader.receipts(ready)):
+                if receipt is None:
+                    # 区块被回滚, 重新等待上链
+                    self.pending[tx_hash]['block'] = None
+                    continue
+                entry = self.pending.pop(tx_hash)
+                if not entry['future'].done():
+                    entry['future'].set_result(receipt)
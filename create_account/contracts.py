@@ -0,0 +1,45 @@
+import functools
+import json
+import os
+
+from eth_abi import encode_abi
+from eth_utils import function_signature_to_4byte_selector
+
+ROOT_PATH = os.path.split(os.path.realpath(__file__))[0]
+
+# 热路径上使用的合约函数: 名称 -> (abi 文件, 函数名)
+FUNCTIONS = {
+    "allowance": ("ERC20", "allowance"),
+    "approve": ("ERC20", "approve"),
+    "balanceOf": ("ERC20", "balanceOf"),
+    "deposit": ("ERC20Staking", "deposit"),
+    "multi_send_token": ("MultiSend", "multi_send_token"),
+}
+
+
+@functools.lru_cache(maxsize=None)
+def get_abi(name: str):
+    """进程内缓存已解析的 abi"""
+    with open(f"{ROOT_PATH}/abis/{name}.json") as file:
+        return json.load(file)
+
+
+@functools.lru_cache(maxsize=None)
+def get_input_types(abi_name: str, fn_name: str):
+    for item in get_abi(abi_name):
+        if item.get('type') == 'function' and item['name'] == fn_name:
+            return [arg['type'] for arg in item['inputs']]
+    raise Exception(f"Function {fn_name} not found in {abi_name} abi")
+
+
+def _selector(abi_name, fn_name):
+    return function_signature_to_4byte_selector(f"{fn_name}({','.join(get_input_types(abi_name, fn_name))})")
+
+
+SELECTORS = {name: _selector(abi_name, fn_name) for name, (abi_name, fn_name) in FUNCTIONS.items()}
+
+
+def encode_call(name: str, *args):
+    """使用预计算的函数选择器编码 calldata, 不经过 web3 合约对象"""
+    abi_name, fn_name = FUNCTIONS[name]
+    return "0x" + (SELECTORS[name] + encode_abi(get_input_types(abi_name, fn_name), args)).hex()
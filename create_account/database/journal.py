@@ -0,0 +1,19 @@
+import datetime
+
+from mongoengine import *
+
+
+class Journal(Document):
+    """交易预写日志: 广播前记录交易及其确认后要写入 Keys 的状态, 用于崩溃后对账续跑"""
+    meta = {"collection": "journal", "indexes": ["status"]}
+    txHash = StringField(primary_key=True)
+    sender = StringField()
+    nonce = IntField()
+    rawTx = StringField()
+    phase = StringField()
+    accountIds = ListField(IntField())
+    recipients = ListField(StringField())
+    # 确认后写入 Keys 的字段
+    changes = DictField(db_field="update")
+    status = StringField(default="pending", choices=("pending", "done", "failed"))
+    created = DateTimeField(default=datetime.datetime.utcnow)
@@ -1,10 +1,35 @@
 from mongoengine import *
+from mongoengine.connection import get_db
+from pymongo import ReturnDocument
 
 
 class Keys(Document):
-    meta = {"collection": "keys"}
+    meta = {"collection": "keys", "indexes": [("isTransfer", "isMortgage", "id"), ("transferred", "id")]}
     id = SequenceField(primary_key=True)
     address = StringField()
     privateKey = StringField()
     isTransfer = IntField(default=0)
+    transferred = ListField(StringField())
     isMortgage = BooleanField(default=False)
+    # 多实例租约: {租约名: {'owner': 实例标识, 'expires': 过期时间}}
+    leases = DictField()
+
+    @classmethod
+    def _sequence_id(cls):
+        field = cls._fields['id']
+        return field, f"{field.get_sequence_name()}.{field.name}"
+
+    @classmethod
+    def allocate_ids(cls, count):
+        """一次计数器更新分配 count 个连续 id, 返回第一个 id"""
+        field, sequence_id = cls._sequence_id()
+        counters = get_db(alias=field.db_alias)[field.collection_name]
+        counter = counters.find_one_and_update(filter={"_id": sequence_id}, update={"$inc": {"next": count}}, return_document=ReturnDocument.AFTER, upsert=True)
+        return counter['next'] - count + 1
+
+    @classmethod
+    def sync_sequence(cls):
+        """将计数器重置为当前最大 id, 中断后续跑时回收未写入的 id"""
+        field, _ = cls._sequence_id()
+        last = cls.objects.order_by('-id').only('id').first()
+        return field.set_next_value(last.id if last else 0)
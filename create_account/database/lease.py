@@ -0,0 +1,9 @@
+from mongoengine import *
+
+
+class Lease(Document):
+    """多实例共享资源(如资金钱包)的租约, 同一时间只有一个实例持有; 实例退出后租约过期即可被其他实例接手"""
+    meta = {"collection": "lease"}
+    name = StringField(primary_key=True)
+    owner = StringField()
+    expires = DateTimeField()
@@ -0,0 +1,18 @@
+from mongoengine import *
+
+
+class Plan(Document):
+    """编译后的分发计划: 每个文档对应一个资金钱包发出的一笔 MultiSend, 发送阶段按 batch 顺序流式读取"""
+    meta = {"collection": "plan", "indexes": [("wallet", "symbol", "status", "batch")]}
+    wallet = StringField()
+    symbol = StringField()
+    token = StringField()
+    seed = IntField()
+    batch = IntField()
+    accountIds = ListField(IntField())
+    recipients = ListField(StringField())
+    # wei 数值超出 int64, 以十进制字符串保存
+    amounts = ListField(StringField())
+    data = StringField()
+    value = StringField()
+    status = StringField(default="pending", choices=("pending", "done"))
@@ -0,0 +1,62 @@
+import csv
+import gzip
+import io
+import json
+
+# Keys 可导出的字段, CSV 列按此顺序排列
+FIELDS = ("_id", "address", "privateKey", "isTransfer", "transferred", "isMortgage")
+
+
+def detect_format(path: str):
+    """根据扩展名判断格式, .csv / .csv.gz 为 CSV, 其他为 NDJSON"""
+    name = path[:-3] if path.endswith(".gz") else path
+    return "csv" if name.endswith(".csv") else "ndjson"
+
+
+def open_text(path: str, mode: str, compress=None):
+    """以文本方式打开文件, compress 为 None 时按'.gz'扩展名决定是否 gzip 压缩"""
+    if compress is None:
+        compress = path.endswith(".gz")
+    if compress:
+        return io.TextIOWrapper(gzip.open(path, mode + "b"), encoding="utf-8", newline="")
+    return open(path, mode, encoding="utf-8", newline="")
+
+
+class Writer:
+    """逐条写入 Keys 文档, 不在内存中保留已写出的数据"""
+
+    def __init__(self, file, fmt="ndjson", fields=FIELDS) -> None:
+        self.file = file
+        self.fmt = fmt
+        self.fields = fields
+        self.csv = None
+        if fmt == "csv":
+            self.csv = csv.writer(file)
+            self.csv.writerow(fields)
+
+    def write(self, doc):
+        if self.csv:
+            self.csv.writerow([";".join(doc.get(field, [])) if field == "transferred" else doc.get(field, "") for field in self.fields])
+        else:
+            self.file.write(json.dumps({field: doc[field] for field in self.fields if field in doc}) + "\n")
+
+
+def read(file, fmt="ndjson"):
+    """逐条读取 Writer 写出的文档, CSV 中的数值和列表字段还原为原类型"""
+    if fmt != "csv":
+        for line in file:
+            if line.strip():
+                yield json.loads(line)
+        return
+    for row in csv.DictReader(file):
+        doc = {}
+        for field, value in row.items():
+            if field in ("_id", "isTransfer"):
+                doc[field] = int(value)
+            elif field == "isMortgage":
+                doc[field] = value == "True"
+            elif field == "transferred":
+                doc[field] = value.split(";") if value else []
+            else:
+                doc[field] = value
+        yield doc
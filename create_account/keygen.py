@@ -0,0 +1,27 @@
+from eth_account import Account
+from eth_account.hdaccount import key_from_seed, seed_from_mnemonic
+
+
+def create_keys(job):
+    """在子进程中生成一批账户, job 为 (起始序号, 数量), 返回 [(address, privateKey)]"""
+    start, count = job
+    keys = []
+    for i in range(start, start + count):
+        new_account = Account.create(extra_entropy=f"nutbox bot account {i}")
+        keys.append((new_account.address, new_account.privateKey.hex()))
+    return keys
+
+
+def hd_seed(mnemonic: str, passphrase=""):
+    return seed_from_mnemonic(mnemonic, passphrase)
+
+
+def derive_key(seed: bytes, path: str, index: int):
+    """按 BIP-32/44 路径'{path}/{index}'派生私钥"""
+    return "0x" + key_from_seed(seed, f"{path}/{index}").hex()
+
+
+def derive_addresses(job):
+    """在子进程中按序号派生一批地址, job 为 (seed, path, 起始序号, 数量), 返回 [address]"""
+    seed, path, start, count = job
+    return [Account.from_key(key_from_seed(seed, f"{path}/{i}")).address for i in range(start, start + count)]
@@ -1,12 +1,38 @@
+import atexit
 import datetime
+import json
 import logging
 import logging.handlers
+import queue
 import sys
 
+# 可通过 extra 传入并在 JSON 日志中输出的结构化字段
+FIELDS = ("tx_hash", "account_id", "phase", "latency")
+
+
+class JsonFormatter(logging.Formatter):
+    """每条日志输出为一行 JSON"""
+
+    def format(self, record):
+        item = {'time': self.formatTime(record), 'name': record.name, 'level': record.levelname, 'message': record.getMessage()}
+        for field in FIELDS:
+            if hasattr(record, field):
+                item[field] = getattr(record, field)
+        if record.exc_info:
+            item['exc'] = self.formatException(record.exc_info)
+        return json.dumps(item, default=str)
+
+
+class LazyQueueHandler(logging.handlers.QueueHandler):
+    """只把日志记录放入队列, 消息在后台线程中才格式化; 参数在格式化前不应再被修改"""
+
+    def prepare(self, record):
+        return record
+
 
 class Logger(object):
 
-    def __init__(self, name="validator_monitor", debug=False, screen=True, email: dict = None, secure=()):
+    def __init__(self, name="validator_monitor", debug=False, screen=True, email: dict = None, secure=(), use_queue=False, json_lines=False):
         self.is_debug = debug
         self.path_prefix = f"logs/{name}"
         self.logger = logging.getLogger("%s_logger" % name)
@@ -14,7 +40,10 @@ class Logger(object):
             self.logger.setLevel(logging.DEBUG)
         else:
             self.logger.setLevel(logging.WARNING)
-        self.formatter = logging.Formatter("[%(asctime)s %(name)s %(levelname)s]: %(message)s")
+        if json_lines:
+            self.formatter = JsonFormatter()
+        else:
+            self.formatter = logging.Formatter("[%(asctime)s %(name)s %(levelname)s]: %(message)s")
 
         if screen:
             self.print_handle = logging.StreamHandler(sys.stdout)
@@ -43,6 +72,28 @@ class Logger(object):
         self.debug_handler.setFormatter(self.formatter)
         self.logger.addHandler(self.debug_handler)
 
+        self.listener = None
+        if use_queue:
+            # 控制台和文件 IO 移到后台线程, 调用方只做一次入队
+            handlers = list(self.logger.handlers)
+            for handler in handlers:
+                self.logger.removeHandler(handler)
+            records = queue.SimpleQueue()
+            self.logger.addHandler(LazyQueueHandler(records))
+            self.listener = logging.handlers.QueueListener(records, *handlers, respect_handler_level=True)
+            self.listener.start()
+            atexit.register(self.close)
+
+    def is_enabled(self, level=logging.DEBUG):
+        """判断该级别是否会输出, 用于跳过开销较大的参数计算"""
+        return self.logger.isEnabledFor(level)
+
+    def close(self):
+        """停止后台线程并写出队列中剩余的日志"""
+        if self.listener:
+            self.listener.stop()
+            self.listener = None
+
     def debug(self, msg, *args, **kwargs):
         self.logger.debug(msg, *args, **kwargs)
 
@@ -30,24 +30,44 @@ URL: <{url}>
     arg_parser.add_argument('-V', '--version', action='version', version='{0} {1}'.format(metadata.project, metadata.version))
     arg_parser.add_argument('-D', '--debug', action='store_true', help='debug mode')
     arg_parser.add_argument('-G', '--generate', action='store_true', help='generate address')
+    arg_parser.add_argument('-B', '--bulk', action='store_true', help='generate address with process pool and bulk insert')
     arg_parser.add_argument('-C', '--clean', action='store_true', help='clean address in database')
     arg_parser.add_argument('-E', '--export', help='Export data to file')
+    arg_parser.add_argument('-I', '--import', dest='import_path', help='Import data exported by --export')
+    arg_parser.add_argument('--format', choices=('ndjson', 'csv'), help='export/import file format, default by file extension')
+    arg_parser.add_argument('--fields', help='comma separated fields to export, e.g. address')
+    arg_parser.add_argument('--gzip', action='store_true', default=None, help='gzip compress the export/import file')
+    arg_parser.add_argument('--is-transfer', type=int, help='export only addresses with this isTransfer')
+    arg_parser.add_argument('--is-mortgage', choices=('true', 'false'), help='export only addresses with this isMortgage')
     arg_parser.add_argument('-T', '--transfer', action='store_true', help='Distribute tokens')
     arg_parser.add_argument('-S', '--staking', action='store_true', help='staking tokens')
+    arg_parser.add_argument('-W', '--sweep', action='store_true', help='sweep leftover BNB of staked addresses')
 
     args = arg_parser.parse_args(args=argv[1:])
     config_info = procConfig(args.config)
-    server = Server(config_info, args.debug)
-    if args.generate:
+    if config_info.get('async_engine'):
+        from create_account.async_server import AsyncServer
+        server = AsyncServer(config_info, args.debug)
+    else:
+        server = Server(config_info, args.debug)
+    if args.generate and args.bulk:
+        server.generate_address_bulk()
+    elif args.generate:
         server.generate_address()
     elif args.clean:
         server.drop_data()
     elif args.export:
-        server.export_data(args.export)
+        is_mortgage = None if args.is_mortgage is None else args.is_mortgage == 'true'
+        fields = args.fields.split(',') if args.fields else None
+        server.export_data(args.export, args.format, fields, args.gzip, args.is_transfer, is_mortgage)
+    elif args.import_path:
+        server.import_data(args.import_path, args.format, args.gzip)
     elif args.transfer:
         server.run_transfer()
     elif args.staking:
         server.run_staking()
+    elif args.sweep:
+        server.run_sweep()
     else:
         server.run()
     return 0
@@ -0,0 +1,34 @@
+import asyncio
+
+
+class NonceManager:
+    """在本地为单个账户顺序分配 nonce, 调用 resync 与链上重新同步
+
+    fetch 为读取链上 pending nonce 的协程函数, 仅在首次分配或 resync 之后调用;
+    多个任务共用同一序列时, 一笔发送失败后调用 halt 停止分配, 避免其他任务在 nonce 空缺之后继续发送
+    """
+
+    def __init__(self, fetch, address) -> None:
+        self.fetch = fetch
+        self.address = address
+        self._lock = asyncio.Lock()
+        self._nonce = None
+        self.error = None
+
+    async def next(self):
+        async with self._lock:
+            if self.error:
+                raise Exception(f"Nonce of {self.address} halted: {self.error}")
+            if self._nonce is None:
+                self._nonce = await self.fetch(self.address)
+            nonce = self._nonce
+            self._nonce += 1
+            return nonce
+
+    def halt(self, error):
+        if self.error is None:
+            self.error = error
+
+    def resync(self):
+        self._nonce = None
+        self.error = None
@@ -0,0 +1,75 @@
+import asyncio
+import math
+import statistics
+import time
+
+
+class FeeOracle:
+    """按最近区块的手续费给出交易手续费和 gas 上限建议, 结果缓存'ttl'秒由所有 worker 共用
+
+    优先使用 eth_feeHistory 取最近'blocks'个区块打包小费的'percentile'分位数, 节点不支持时退回 eth_gasPrice;
+    记录每类交易使用的 gas 上限与实际消耗, 有样本后按最大实际消耗乘以'margin'给出 gas 上限
+    """
+
+    def __init__(self, reader, ttl=6, blocks=10, percentile=50, eip1559=False, max_gas_price=0, margin=1.2) -> None:
+        self.reader = reader
+        self.ttl = ttl
+        self.blocks = blocks
+        self.percentile = percentile
+        self.eip1559 = eip1559
+        self.max_gas_price = max_gas_price
+        self.margin = margin
+        self.usage = {}
+        self._sample = None
+        self._sampled_at = 0
+        self._lock = asyncio.Lock()
+
+    async def sample(self):
+        """返回 (下一区块 base fee, 建议小费); 节点不支持 eth_feeHistory 时 base fee 为 None, 小费为 gasPrice"""
+        async with self._lock:
+            if self._sample is None or time.monotonic() - self._sampled_at > self.ttl:
+                self._sample = await self._fetch()
+                self._sampled_at = time.monotonic()
+            return self._sample
+
+    async def _fetch(self):
+        try:
+            history = (await self.reader.request([("eth_feeHistory", [hex(self.blocks), "latest", [self.percentile]])]))[0]
+            base = self.reader._to_int(history['baseFeePerGas'][-1])
+            tips = [self.reader._to_int(reward[0]) for reward in history.get('reward') or [] if reward]
+            tip = int(statistics.median(tips)) if tips else 0
+            if base or tip:
+                return base, tip
+        except Exception:
+            pass
+        return None, self.reader._to_int((await self.reader.request([("eth_gasPrice", [])]))[0])
+
+    def _cap(self, price):
+        return min(price, self.max_gas_price) if self.max_gas_price else price
+
+    async def fees(self):
+        """返回可直接写入交易的手续费字段"""
+        base, tip = await self.sample()
+        if self.eip1559 and base is not None:
+            tip = self._cap(tip)
+            # 预留两倍 base fee, 连续多个满区块后仍可打包
+            return {'maxFeePerGas': self._cap(2 * base + tip), 'maxPriorityFeePerGas': tip}
+        return {'gasPrice': self._cap((base or 0) + tip)}
+
+    def gas_limit(self, kind, default):
+        """该类交易的 gas 上限建议, 尚无实际消耗记录时返回 default"""
+        usage = self.usage.get(kind)
+        if not usage:
+            return default
+        return math.ceil(usage['max_used'] * self.margin)
+
+    def record(self, kind, limit, used):
+        usage = self.usage.setdefault(kind, {'count': 0, 'limit': 0, 'used': 0, 'max_used': 0})
+        usage['count'] += 1
+        usage['limit'] += limit
+        usage['used'] += used
+        usage['max_used'] = max(usage['max_used'], used)
+
+    def report(self):
+        return "; ".join(f"{kind}: {usage['count']} tx, limit {usage['limit'] // usage['count']}, used {usage['used'] // usage['count']}, "
+                         f"max used {usage['max_used']}" for kind, usage in self.usage.items())
@@ -0,0 +1,224 @@
+import asyncio
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from aiohttp import ClientSession, ClientTimeout
+from requests.adapters import HTTPAdapter
+from web3.providers.async_base import AsyncJSONBaseProvider
+from web3.providers.base import JSONBaseProvider
+
+# 节点限流时返回的 JSON-RPC 错误码
+THROTTLED_CODES = (-32005, 429)
+
+
+class Endpoint:
+
+    def __init__(self, uri) -> None:
+        self.uri = uri
+        self.latency = 0.0
+        self.samples = 0
+        self.failures = 0
+        self.evicted_until = 0
+        # 每个节点独立的 keep-alive 连接, 不使用 web3 按 URI 全局缓存(最多 8 个)的 session
+        self.session = None
+        self.loop = None
+
+
+class EndpointPool:
+    """节点列表及其滚动延迟和失败计数, 由同步和异步连接池共用"""
+
+    def _init_pool(self, endpoint_uris, broadcast, max_failures, evict_seconds, request_kwargs):
+        self.endpoints = [Endpoint(uri) for uri in endpoint_uris]
+        self.broadcast = broadcast
+        self.max_failures = max_failures
+        self.evict_seconds = evict_seconds
+        self.request_kwargs = request_kwargs or {}
+        self.request_kwargs.setdefault('headers', {'Content-Type': 'application/json'})
+        self._lock = threading.Lock()
+
+    def __str__(self) -> str:
+        return f"RPC pool {[endpoint.uri for endpoint in self.endpoints]}"
+
+    def healthy(self):
+        """按滚动延迟排序的可用节点; 全部被剔除时返回所有节点"""
+        now = time.monotonic()
+        with self._lock:
+            endpoints = [endpoint for endpoint in self.endpoints if endpoint.evicted_until <= now] or list(self.endpoints)
+            return sorted(endpoints, key=lambda endpoint: endpoint.latency)
+
+    def _record(self, endpoint, latency=None):
+        with self._lock:
+            if latency is None:
+                endpoint.failures += 1
+                if endpoint.failures >= self.max_failures:
+                    endpoint.evicted_until = time.monotonic() + self.evict_seconds
+                    endpoint.failures = 0
+                return
+            endpoint.failures = 0
+            endpoint.latency = latency if endpoint.samples == 0 else endpoint.latency * 0.7 + latency * 0.3
+            endpoint.samples += 1
+
+    def _pick(self, responses, error):
+        """广播结果中任一节点接受即返回成功结果"""
+        for response in responses:
+            if 'result' in response:
+                return response
+        if responses:
+            return responses[0]
+        raise error
+
+
+class PooledHTTPProvider(EndpointPool, JSONBaseProvider):
+    """多 RPC 节点连接池
+
+    读请求路由到滚动延迟最低的健康节点, 失败时依次切换; eth_sendRawTransaction 同时广播到'broadcast'个节点;
+    连续失败'max_failures'次的节点被剔除'evict_seconds'秒。每个节点使用独立的 requests.Session,
+    各线程共用其中最多'pool_size'个 keep-alive 连接
+    """
+
+    def __init__(self, endpoint_uris, broadcast=2, max_failures=3, evict_seconds=60, request_kwargs=None, pool_size=16) -> None:
+        super().__init__()
+        self._init_pool(endpoint_uris, broadcast, max_failures, evict_seconds, request_kwargs)
+        self.request_kwargs.setdefault('timeout', 10)
+        for endpoint in self.endpoints:
+            endpoint.session = requests.Session()
+            endpoint.session.mount(endpoint.uri, HTTPAdapter(pool_connections=1, pool_maxsize=pool_size))
+        self._executor = ThreadPoolExecutor(max_workers=max(len(self.endpoints), 1))
+
+    def close(self):
+        for endpoint in self.endpoints:
+            endpoint.session.close()
+        self._executor.shutdown()
+
+    def _post_to(self, endpoint, data):
+        start = time.monotonic()
+        try:
+            response = endpoint.session.post(endpoint.uri, data=data, **self.request_kwargs)
+            response.raise_for_status()
+            raw = response.content
+        except Exception:
+            self._record(endpoint)
+            raise
+        self._record(endpoint, time.monotonic() - start)
+        return raw
+
+    def post(self, data):
+        """发送原始请求体到最快的健康节点, 失败时切换到下一个节点"""
+        error = None
+        for endpoint in self.healthy():
+            try:
+                return self._post_to(endpoint, data)
+            except Exception as e:
+                error = e
+        raise error
+
+    def make_request(self, method, params):
+        data = self.encode_rpc_request(method, params)
+        if method == "eth_sendRawTransaction":
+            return self._broadcast(data)
+        response = error = None
+        for endpoint in self.healthy():
+            try:
+                response = self.decode_rpc_response(self._post_to(endpoint, data))
+            except Exception as e:
+                error = e
+                continue
+            if response.get('error', {}).get('code') in THROTTLED_CODES:
+                self._record(endpoint)
+                continue
+            return response
+        if response is not None:
+            return response
+        raise error
+
+    def _broadcast(self, data):
+        """广播到多个节点, 任一节点接受即返回成功结果"""
+        futures = [self._executor.submit(self._post_to, endpoint, data) for endpoint in self.healthy()[:self.broadcast]]
+        responses = []
+        error = None
+        for future in futures:
+            try:
+                responses.append(self.decode_rpc_response(future.result()))
+            except Exception as e:
+                error = e
+        return self._pick(responses, error)
+
+
+class AsyncPooledHTTPProvider(EndpointPool, AsyncJSONBaseProvider):
+    """PooledHTTPProvider 的异步版本, 供 AsyncServer 使用, 路由、切换、剔除和广播规则相同
+
+    每个节点的 aiohttp session 在首次请求时于当前事件循环中创建, 事件循环改变时重新创建
+    """
+
+    def __init__(self, endpoint_uris, broadcast=2, max_failures=3, evict_seconds=60, request_kwargs=None) -> None:
+        super().__init__()
+        self._init_pool(endpoint_uris, broadcast, max_failures, evict_seconds, request_kwargs)
+        self.request_kwargs.setdefault('timeout', ClientTimeout(10))
+
+    def _session(self, endpoint):
+        loop = asyncio.get_running_loop()
+        if endpoint.session is None or endpoint.session.closed or endpoint.loop is not loop:
+            endpoint.session = ClientSession(raise_for_status=True)
+            endpoint.loop = loop
+        return endpoint.session
+
+    async def close(self):
+        for endpoint in self.endpoints:
+            if endpoint.session is not None and endpoint.loop is asyncio.get_running_loop():
+                await endpoint.session.close()
+            endpoint.session = None
+
+    async def _post_to(self, endpoint, data):
+        start = time.monotonic()
+        try:
+            async with self._session(endpoint).post(endpoint.uri, data=data, **self.request_kwargs) as response:
+                raw = await response.read()
+        except Exception:
+            self._record(endpoint)
+            raise
+        self._record(endpoint, time.monotonic() - start)
+        return raw
+
+    async def post(self, data):
+        error = None
+        for endpoint in self.healthy():
+            try:
+                return await self._post_to(endpoint, data)
+            except Exception as e:
+                error = e
+        raise error
+
+    async def make_request(self, method, params):
+        data = self.encode_rpc_request(method, params)
+        if method == "eth_sendRawTransaction":
+            return await self._broadcast(data)
+        response = error = None
+        for endpoint in self.healthy():
+            try:
+                response = self.decode_rpc_response(await self._post_to(endpoint, data))
+            except Exception as e:
+                error = e
+                continue
+            if response.get('error', {}).get('code') in THROTTLED_CODES:
+                self._record(endpoint)
+                continue
+            return response
+        if response is not None:
+            return response
+        raise error
+
+    async def _broadcast(self, data):
+        results = await asyncio.gather(*[self._post_to(endpoint, data) for endpoint in self.healthy()[:self.broadcast]], return_exceptions=True)
+        responses = []
+        error = None
+        for result in results:
+            if isinstance(result, Exception):
+                error = result
+                continue
+            try:
+                responses.append(self.decode_rpc_response(result))
+            except Exception as e:
+                error = e
+        return self._pick(responses, error)
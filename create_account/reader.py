@@ -0,0 +1,75 @@
+import asyncio
+
+from create_account.contracts import encode_call
+
+
+class BatchReader:
+    """将大量账户的只读查询合并为 JSON-RPC batch 请求
+
+    post 为发送一个 batch 负载并返回响应列表的协程函数, 每个 batch 最多 batch_size 个请求
+    """
+
+    def __init__(self, post, batch_size=200) -> None:
+        self.post = post
+        self.batch_size = batch_size
+
+    async def request(self, calls):
+        """calls 为 [(method, params)], 按顺序返回各请求的 result"""
+        chunks = [calls[i:i + self.batch_size] for i in range(0, len(calls), self.batch_size)]
+        results = await asyncio.gather(*[self._request_chunk(chunk) for chunk in chunks])
+        return [item for chunk in results for item in chunk]
+
+    async def _request_chunk(self, calls):
+        payload = [{'jsonrpc': '2.0', 'id': i, 'method': method, 'params': params} for i, (method, params) in enumerate(calls)]
+        response = await self.post(payload)
+        if not isinstance(response, list):
+            raise Exception(f"Batch request error: {response}")
+        items = {item.get('id'): item for item in response}
+        results = []
+        for i, (method, params) in enumerate(calls):
+            item = items.get(i)
+            if item is None or 'error' in item:
+                raise Exception(f"Batch {method} {params} error: {item}")
+            results.append(item['result'])
+        return results
+
+    @staticmethod
+    def _to_int(value):
+        return int(value, 16) if value and value != "0x" else 0
+
+    async def balances(self, addresses):
+        results = await self.request([("eth_getBalance", [address, "latest"]) for address in addresses])
+        return [self._to_int(item) for item in results]
+
+    async def nonces(self, addresses, block="pending"):
+        results = await self.request([("eth_getTransactionCount", [address, block]) for address in addresses])
+        return [self._to_int(item) for item in results]
+
+    async def token_balances(self, token, addresses):
+        calls = [("eth_call", [{'to': token, 'data': encode_call("balanceOf", address)}, "latest"]) for address in addresses]
+        return [self._to_int(item) for item in await self.request(calls)]
+
+    async def allowances(self, token, owners, spender):
+        calls = [("eth_call", [{'to': token, 'data': encode_call("allowance", owner, spender)}, "latest"]) for owner in owners]
+        return [self._to_int(item) for item in await self.request(calls)]
+
+    async def block_number(self):
+        return self._to_int((await self.request([("eth_blockNumber", [])]))[0])
+
+    async def block_transactions(self, numbers):
+        """返回各区块包含的交易哈希列表"""
+        results = await self.request([("eth_getBlockByNumber", [hex(number), False]) for number in numbers])
+        return [[tx_hash.lower() for tx_hash in block['transactions']] if block else [] for block in results]
+
+    async def receipts(self, tx_hashes):
+        """批量查询交易回执, 未上链的交易返回 None"""
+        results = await self.request([("eth_getTransactionReceipt", [tx_hash]) for tx_hash in tx_hashes])
+        receipts = []
+        for receipt in results:
+            if receipt:
+                receipt = dict(receipt)
+                for key in ("status", "gasUsed", "blockNumber", "cumulativeGasUsed", "effectiveGasPrice"):
+                    if key in receipt:
+                        receipt[key] = self._to_int(receipt[key])
+            receipts.append(receipt)
+        return receipts
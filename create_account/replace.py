@@ -0,0 +1,144 @@
+import asyncio
+import math
+import time
+
+
+def fee_per_gas(tx):
+    return tx.get('maxFeePerGas', tx.get('gasPrice'))
+
+
+class ReplacementEngine:
+    """等待已广播交易上链, 超过'after_blocks'个区块仍未打包时以相同 nonce 提高手续费重新签名广播
+
+    同一 nonce 的所有版本一起确认, 返回最终上链的那一笔; 支持 legacy gasPrice 和 EIP-1559 两种手续费。
+    传入 tracker(ConfirmationTracker)时跟随其区块推送计数并由其确认各版本, 否则自行轮询回执;
+    转出全部余额的交易(sweep)提价时从 value 中扣除多出的手续费, 否则替换交易会因余额不足被拒绝
+    """
+
+    def __init__(self, reader, resend, after_blocks, bump=1.125, max_bumps=5, max_gas_price=0, timeout=600, poll_interval=3, tracker=None) -> None:
+        self.reader = reader
+        self.resend = resend
+        self.after_blocks = after_blocks
+        self.bump = bump
+        self.max_bumps = max_bumps
+        self.max_gas_price = max_gas_price
+        self.timeout = timeout
+        self.poll_interval = poll_interval
+        self.tracker = tracker
+        self.inflight = {}
+
+    def track(self, tx_hash, tx, key, journal=None, sweep=False):
+        self.inflight[tx_hash.lower()] = (tx, key, journal, sweep)
+
+    def tracked(self, tx_hash):
+        return tx_hash.lower() in self.inflight
+
+    def _raise(self, price):
+        price = math.ceil(price * self.bump)
+        return min(price, self.max_gas_price) if self.max_gas_price else price
+
+    def bumped(self, tx, sweep=False):
+        """返回提高手续费后的交易, 已到达上限或 sweep 交易的余额不够支付新手续费时返回 None"""
+        replacement = dict(tx)
+        if 'maxFeePerGas' in tx:
+            fee = self._raise(tx['maxFeePerGas'])
+            if fee <= tx['maxFeePerGas']:
+                return None
+            replacement['maxFeePerGas'] = fee
+            replacement['maxPriorityFeePerGas'] = min(math.ceil(tx['maxPriorityFeePerGas'] * self.bump), fee)
+        else:
+            price = self._raise(tx['gasPrice'])
+            if price <= tx['gasPrice']:
+                return None
+            replacement['gasPrice'] = price
+        if sweep:
+            extra = tx['gas'] * (fee_per_gas(replacement) - fee_per_gas(tx))
+            if tx['value'] <= extra:
+                return None
+            replacement['value'] = tx['value'] - extra
+        return replacement
+
+    async def _bump(self, tx, key, journal, sweep, hashes, errors):
+        """提价重发一次, 返回 (最新交易, 是否还能继续提价)"""
+        replacement = self.bumped(tx, sweep)
+        if replacement is None:
+            return tx, False
+        try:
+            hashes.append(await self.resend(replacement, key, journal))
+        except Exception as e:
+            errors.append(e)
+            # 余额不足时提价也无法广播; 其他错误(如手续费不足以替换)在下一次更高的手续费上重试
+            if "insufficient funds" in str(e).lower():
+                return tx, False
+        return replacement, True
+
+    def _timeout_error(self, tx_hash, errors):
+        reason = f", last replacement error: {errors[-1]}" if errors else ""
+        return Exception(f"Transaction {tx_hash} is not in the chain after {self.timeout} seconds{reason}")
+
+    async def wait(self, tx_hash):
+        """返回 (上链交易哈希, 回执, 该 nonce 广播过的所有哈希)"""
+        tx, key, journal, sweep = self.inflight.pop(tx_hash.lower())
+        if self.tracker:
+            return await self._wait_blocks(tx_hash, tx, key, journal, sweep)
+        return await self._wait_poll(tx_hash, tx, key, journal, sweep)
+
+    async def _wait_poll(self, tx_hash, tx, key, journal, sweep):
+        hashes = [tx_hash]
+        errors = []
+        start = time.monotonic()
+        since = await self.reader.block_number()
+        bumps = 0
+        can_bump = True
+        while True:
+            for sent, receipt in zip(hashes, await self.reader.receipts(hashes)):
+                if receipt:
+                    return sent, receipt, hashes
+            head = await self.reader.block_number()
+            if head - since >= self.after_blocks and can_bump and bumps < self.max_bumps:
+                since = head
+                bumps += 1
+                tx, can_bump = await self._bump(tx, key, journal, sweep, hashes, errors)
+            if time.monotonic() - start > self.timeout:
+                raise self._timeout_error(tx_hash, errors)
+            await asyncio.sleep(self.poll_interval)
+
+    async def _wait_blocks(self, tx_hash, tx, key, journal, sweep):
+        hashes = [tx_hash]
+        errors = []
+        futures = {tx_hash: self.tracker.add(tx_hash)}
+        deadline = time.monotonic() + self.timeout
+        since = self.tracker.head
+        bumps = 0
+        can_bump = True
+        block = None
+        try:
+            while True:
+                block = self.tracker.next_block()
+                await asyncio.wait([*futures.values(), block], timeout=max(deadline - time.monotonic(), 0), return_when=asyncio.FIRST_COMPLETED)
+                for sent, future in futures.items():
+                    if future.done() and not future.cancelled() and future.exception() is None:
+                        return sent, future.result(), hashes
+                if all(future.done() for future in futures.values()):
+                    # 所有版本都已超过 tracker 的等待时间
+                    raise next(future.exception() for future in futures.values() if not future.cancelled())
+                if block.done() and not block.cancelled():
+                    head = block.result()
+                    since = head if since is None else since
+                    if head - since >= self.after_blocks and can_bump and bumps < self.max_bumps:
+                        since = head
+                        bumps += 1
+                        tx, can_bump = await self._bump(tx, key, journal, sweep, hashes, errors)
+                        for sent in hashes:
+                            if sent not in futures:
+                                futures[sent] = self.tracker.add(sent)
+                if time.monotonic() > deadline:
+                    raise self._timeout_error(tx_hash, errors)
+        finally:
+            if block and not block.done():
+                block.cancel()
+            for sent, future in futures.items():
+                if not future.done():
+                    self.tracker.discard(sent)
+                elif not future.cancelled():
+                    future.exception()
@@ -1,147 +1,896 @@
 import asyncio
+import datetime
+import functools
 import json
+import math
 import os
 import random
+import socket
+import time
+from concurrent.futures import ProcessPoolExecutor
+from create_account import exporter, keygen
+from create_account.confirm import ConfirmationTracker
+from create_account.contracts import encode_call, get_abi
 from create_account.logger import Logger
+from create_account.nonce import NonceManager
+from create_account.oracle import FeeOracle
+from create_account.provider import PooledHTTPProvider
+from create_account.reader import BatchReader
+from create_account.replace import ReplacementEngine
+from create_account.signer import BulkSigner
+from create_account.throttle import AdaptiveThrottle, BlockRateLimiter
 
 from web3 import Web3
+from web3._utils.request import make_post_request
 from web3.middleware import geth_poa_middleware
 import mongoengine
+from pymongo.errors import BulkWriteError, DuplicateKeyError
+from create_account.database.journal import Journal
 from create_account.database.keys import Keys
+from create_account.database.lease import Lease
+from create_account.database.plan import Plan
 from eth_utils.currency import MAX_WEI, MIN_WEI
 
-ROOT_PATH = os.path.split(os.path.realpath(__file__))[0]
+ZERO_ADDRESS = "0x0000000000000000000000000000000000000000"
+# 随机金额的粒度
+AMOUNT_STEP = int(Web3.toWei(0.5, "ether"))
 
 
 class Server:
 
     def __init__(self, config, debug=False) -> None:
         self.config = config
-        self.logger = Logger("create", debug=debug)
-        self.provider = Web3.HTTPProvider(self.config['chain_rpc'])
-        self.provider.middlewares.clear()
+        self.logger = Logger("create", debug=debug, use_queue=self.config.get('log_queue', False), json_lines=self.config.get('log_json', False))
+        if self.config.get('chain_rpcs'):
+            self.provider = PooledHTTPProvider(self.config['chain_rpcs'], self.config.get('rpc_broadcast', 2))
+        else:
+            self.provider = Web3.HTTPProvider(self.config['chain_rpc'])
+            self.provider.middlewares.clear()
         self.web3 = Web3(self.provider)
         self.web3.middleware_onion.inject(geth_poa_middleware, layer=0)
         self.db_data = mongoengine.connect(db=self.config['mongo']['db'], host=self.config['mongo']['host'])
         self.defaultAccount = self.config['main_account']
         self.post_interval = self.config['post_interval']
+        self.pipeline_depth = self.config.get('pipeline_depth', 1)
+        self.auto_batch = self.config.get('auto_batch', False)
+        self.journal = self.config.get('journal', False)
+        self.unresolved_ids = set()
+        self.hd_seed = None
+        if self.config.get('hd_mnemonic'):
+            self.hd_seed = keygen.hd_seed(self.config['hd_mnemonic'], self.config.get('hd_passphrase', ""))
+            self.hd_path = self.config.get('hd_path', "m/44'/60'/0'/0")
+            self._derive_key = functools.lru_cache(maxsize=self.config.get('hd_cache_size', 4096))(functools.partial(
+                keygen.derive_key, self.hd_seed, self.hd_path))
+        # HD 模式下 Keys 只保存地址和状态, 私钥按 id 派生
+        self.key_fields = ('address', ) if self.hd_seed else ('address', 'privateKey')
+        self.lease_seconds = self.config.get('lease_seconds', 600) if self.config.get('work_lease') else 0
+        self.lease_owner = self.config.get('lease_owner') or f"{socket.gethostname()}:{os.getpid()}"
+        # 本实例持有的账户租约 {租约名: id 集合} 和共享资源租约名, 由心跳任务定期续租
+        self.held = {}
+        self.resources = set()
+        self.wallets = self.config.get('funding_wallets') or [{'address': self.defaultAccount, 'key': self.config['main_account_key']}]
+        self.nonces = {wallet['address']: NonceManager(self._get_nonce, wallet['address']) for wallet in self.wallets}
+        self.chain_id = None
+        self.signer = BulkSigner(self.config.get('sign_workers'))
+        self.reader = BatchReader(self._post_batch, self.config.get('read_batch_size', 200))
+        self.tracker = None
+        if self.config.get('block_tracker'):
+            self.tracker = ConfirmationTracker(self.reader, self.config.get('confirmations', 0), self.config.get('receipt_timeout', 120),
+                                               self.config.get('block_time', 3))
+        self.limiter = BlockRateLimiter(self.config.get('max_submissions_per_block', 0), self.config.get('block_time', 3))
+        self.replacer = None
+        if self.config.get('replace_after_blocks'):
+            self.replacer = ReplacementEngine(self.reader, self._resend, self.config['replace_after_blocks'], self.config.get('replace_bump', 1.125),
+                                              self.config.get('replace_max_bumps', 5), int(Web3.toWei(self.config.get('replace_max_gas_price', 0), 'gwei')),
+                                              self.config.get('receipt_timeout', 600), self.config.get('block_time', 3), self.tracker)
+        self.oracle = None
+        if self.config.get('fee_oracle'):
+            self.oracle = FeeOracle(self.reader, self.config.get('fee_ttl', 6), self.config.get('fee_history_blocks', 10),
+                                    self.config.get('fee_percentile', 50), self.config.get('fee_eip1559', False),
+                                    int(Web3.toWei(self.config.get('replace_max_gas_price', 0), 'gwei')), self.config.get('gas_margin', 1.2))
+        self.throttle = None
+        if self.config.get('adaptive_throttle'):
+            self.throttle = AdaptiveThrottle(self.post_interval, self.config.get('throttle_max_rate', 0), self.config.get('throttle_max_interval', 10),
+                                             self.config.get('throttle_target_latency', 2 * self.config.get('block_time', 3)))
 
     def _get_abi(self, name: str):
-        abi = []
-        with open(f"{ROOT_PATH}/abis/{name}.json") as file:
-            abi = json.load(file)
-        return abi
+        return get_abi(name)
+
+    def _account_key(self, account):
+        """HD 模式下按 id 派生私钥(LRU 缓存), 否则使用数据库中保存的私钥"""
+        return self._derive_key(account.id) if self.hd_seed else account.privateKey
+
+    # 链和数据库的 IO 原语; 同步实现在线程池中执行阻塞调用, AsyncServer 以原生异步客户端覆盖
+
+    async def _run_blocking(self, fn, *args, **kwargs):
+        return await asyncio.get_running_loop().run_in_executor(None, functools.partial(fn, *args, **kwargs))
+
+    async def _call(self, to, data):
+        return await self._run_blocking(self.web3.eth.call, {'to': to, 'data': data})
+
+    async def _get_balance(self, address):
+        return await self._run_blocking(self.web3.eth.get_balance, address)
+
+    async def _get_nonce(self, address):
+        return await self._run_blocking(self.web3.eth.get_transaction_count, address, "pending")
+
+    async def _get_gas_price(self):
+        return await self._run_blocking(lambda: self.web3.eth.gas_price)
+
+    async def _get_chain_id(self):
+        return await self._run_blocking(lambda: self.web3.eth.chain_id)
+
+    async def _estimate_gas(self, tx):
+        return await self._run_blocking(self.web3.eth.estimate_gas, tx)
+
+    async def _get_block_gas_limit(self):
+        return await self._run_blocking(lambda: self.web3.eth.get_block("latest")['gasLimit'])
+
+    async def _send_raw(self, raw_tx):
+        return self.web3.toHex(await self._run_blocking(self.web3.eth.send_raw_transaction, raw_tx))
+
+    async def _poll_receipt(self, tx_hash):
+        return await self._run_blocking(self.web3.eth.wait_for_transaction_receipt, tx_hash)
+
+    async def _post_batch(self, payload):
+        data = json.dumps(payload).encode()
+        if isinstance(self.provider, PooledHTTPProvider):
+            return json.loads(await self._run_blocking(self.provider.post, data))
+        kwargs = dict(self.provider.get_request_kwargs())
+        return json.loads(await self._run_blocking(make_post_request, self.provider.endpoint_uri, data, **kwargs))
+
+    async def _find_transfer_accounts(self, symbol, after_id, limit, shard=None):
+        query = Keys.objects(transferred__ne=symbol, id__gt=after_id)
+        if shard:
+            query = query.filter(id__mod=shard)
+        query = query.only('id', 'address').order_by('id').limit(limit)
+        return await self._run_blocking(lambda: list(query))
+
+    async def _count_transfer_accounts(self, symbol, shard=None):
+        query = Keys.objects(transferred__ne=symbol)
+        if shard:
+            query = query.filter(id__mod=shard)
+        return await self._run_blocking(query.count)
+
+    async def _find_staking_accounts(self, coin_count, after_id, limit):
+        query = Keys.objects(isTransfer=coin_count, isMortgage=False, id__gt=after_id).only('id', *self.key_fields).order_by('id').limit(limit)
+        return await self._run_blocking(lambda: list(query))
+
+    async def _find_sweep_accounts(self, after_id, limit):
+        query = Keys.objects(isMortgage=True, id__gt=after_id).only('id', *self.key_fields).order_by('id').limit(limit)
+        return await self._run_blocking(lambda: list(query))
+
+    async def _find_transferred(self, ids, symbol):
+        """返回 ids 中已记录该币种的账户 id"""
+        query = Keys.objects(id__in=ids, transferred=symbol).only('id')
+        return await self._run_blocking(lambda: {account.id for account in query})
+
+    async def _insert_plan(self, docs):
+        return await self._run_blocking(Plan._get_collection().insert_many, docs, ordered=False)
+
+    async def _count_plan(self, wallet):
+        return await self._run_blocking(Plan.objects(wallet=wallet, status="pending").count)
+
+    async def _find_plan(self, wallet, symbol, after_batch, limit):
+        query = Plan.objects(wallet=wallet, symbol=symbol, status="pending", batch__gt=after_batch).order_by('batch').limit(limit)
+        return await self._run_blocking(lambda: list(query))
+
+    async def _finish_plan(self, wallet, symbol):
+        query = Plan.objects(wallet=wallet, symbol=symbol, status="pending")
+        return await self._run_blocking(lambda: query.update(set__status="done"))
+
+    def _lease_queries(self, ids, lease, query):
+        """返回 (可租用条件, 租用更新, 本实例持有条件); 未被租用、租约过期或已由本实例持有且满足 query 的账户可租用"""
+        field = f"leases.{lease}"
+        now = datetime.datetime.utcnow()
+        claimable = {'_id': {'$in': ids}, **query, '$or': [{f"{field}.owner": self.lease_owner}, {f"{field}.expires": {'$not': {'$gt': now}}}]}
+        update = {'$set': {field: {'owner': self.lease_owner, 'expires': now + datetime.timedelta(seconds=self.lease_seconds)}}}
+        mine = {'_id': {'$in': ids}, **query, f"{field}.owner": self.lease_owner}
+        return claimable, update, mine
+
+    async def _claim(self, ids, lease, query):
+        claimable, update, mine = self._lease_queries(ids, lease, query)
+        collection = Keys._get_collection()
+
+        def claim():
+            collection.update_many(claimable, update)
+            return {doc['_id'] for doc in collection.find(mine, {'_id': 1})}
+
+        return await self._run_blocking(claim)
+
+    async def _release(self, ids, lease):
+        field = f"leases.{lease}"
+        return await self._run_blocking(Keys._get_collection().update_many, {'_id': {'$in': ids}, f"{field}.owner": self.lease_owner}, {'$unset': {field: ""}})
+
+    def _expires(self):
+        return datetime.datetime.utcnow() + datetime.timedelta(seconds=self.lease_seconds)
+
+    def _resource_queries(self, name):
+        """返回 (可租用条件, 租用更新); 未被租用、租约过期或已由本实例持有的资源可租用"""
+        claimable = {'_id': name, '$or': [{'owner': self.lease_owner}, {'expires': {'$not': {'$gt': datetime.datetime.utcnow()}}}]}
+        return claimable, {'$set': {'owner': self.lease_owner, 'expires': self._expires()}}
+
+    async def _claim_resource(self, name):
+        claimable, update = self._resource_queries(name)
+
+        def claim():
+            try:
+                Lease._get_collection().update_one(claimable, update, upsert=True)
+            except DuplicateKeyError:
+                # 资源已由其他实例持有, upsert 插入同名文档失败
+                return False
+            return True
+
+        return await self._run_blocking(claim)
+
+    async def _release_resources(self, names):
+        return await self._run_blocking(Lease._get_collection().delete_many, {'_id': {'$in': names}, 'owner': self.lease_owner})
+
+    async def _renew(self, ids, lease):
+        field = f"leases.{lease}"
+        query = {'_id': {'$in': ids}, f"{field}.owner": self.lease_owner}
+        return await self._run_blocking(Keys._get_collection().update_many, query, {'$set': {f"{field}.expires": self._expires()}})
+
+    async def _renew_resources(self, names):
+        query = {'_id': {'$in': names}, 'owner': self.lease_owner}
+        return await self._run_blocking(Lease._get_collection().update_many, query, {'$set': {'expires': self._expires()}})
+
+    async def _find_account(self, id):
+        return await self._run_blocking(lambda: Keys.objects(id=id).only('id', 'address').first())
+
+    async def _update_accounts(self, ids, **fields):
+        update = {f"set__{name}": value for name, value in fields.items()}
+        return await self._run_blocking(lambda: Keys.objects(id__in=ids).update(**update))
+
+    async def _mark_transferred(self, ids, symbol):
+        # 只更新尚未记录该币种的账户, 重放日志时不会重复计数
+        query = Keys.objects(id__in=ids, transferred__ne=symbol)
+        return await self._run_blocking(lambda: query.update(add_to_set__transferred=symbol, inc__isTransfer=1))
+
+    async def _migrate_transfer_progress(self, symbols):
+        # 旧数据只有按顺序递增的 isTransfer, 换算为已收到的币种列表
+        for count in range(1, len(symbols) + 1):
+            query = Keys.objects(transferred__exists=False, isTransfer=count)
+            await self._run_blocking(lambda: query.update(set__transferred=symbols[:count]))
+
+    async def _claim_accounts(self, accounts, lease, query):
+        """开启'work_lease'时原子地租用账户并续租已持有的账户, 返回本实例持有租约的账户; 否则原样返回"""
+        if not self.lease_seconds or not accounts:
+            return accounts
+        claimed = await self._claim([account.id for account in accounts], lease, query)
+        if len(claimed) < len(accounts):
+            self.logger.debug(f"Lease {lease}: {len(accounts) - len(claimed)} of {len(accounts)} accounts held by other workers")
+        self.held.setdefault(lease, set()).update(claimed)
+        return [account for account in accounts if account.id in claimed]
+
+    async def _release_accounts(self, ids, lease):
+        if self.lease_seconds:
+            await self._release(ids, lease)
+            self.held.get(lease, set()).difference_update(ids)
+
+    async def _claim_wallets(self):
+        """返回 [(资金钱包, 分片)]; 开启'work_lease'时只返回本实例租到的钱包(最多'wallets_per_worker'个, 0 为不限),
+        每个钱包的 nonce 序列和分发计划只由一个实例使用
+
+        分片按全部配置的钱包计算, 与哪个实例持有无关
+        """
+        shards = [(len(self.wallets), i) if len(self.wallets) > 1 else None for i in range(len(self.wallets))]
+        if not self.lease_seconds:
+            return list(zip(self.wallets, shards))
+        limit = self.config.get('wallets_per_worker', 1) or len(self.wallets)
+        owned = []
+        for wallet, shard in zip(self.wallets, shards):
+            if len(owned) >= limit:
+                break
+            name = f"wallet:{wallet['address']}"
+            if await self._claim_resource(name):
+                self.resources.add(name)
+                owned.append((wallet, shard))
+        self.logger.debug(f"Claimed {len(owned)} of {len(self.wallets)} funding wallets.")
+        return owned
+
+    async def _renew_leases(self):
+        for lease, ids in self.held.items():
+            if ids:
+                await self._renew(list(ids), lease)
+        if self.resources:
+            await self._renew_resources(list(self.resources))
+
+    async def _heartbeat(self):
+        """每三分之一租期续租一次本实例持有的全部租约, 等待确认的批次不会因租约过期被其他实例重复处理"""
+        while True:
+            await asyncio.sleep(self.lease_seconds / 3)
+            try:
+                await self._renew_leases()
+            except Exception as e:
+                self.logger.warning(f"Renew leases error: {e}")
+
+    async def _with_leases(self, coro):
+        """开启'work_lease'时在 coro 运行期间保持心跳续租, 结束后释放共享资源租约"""
+        if not self.lease_seconds:
+            return await coro
+        heartbeat = asyncio.ensure_future(self._heartbeat())
+        try:
+            return await coro
+        finally:
+            heartbeat.cancel()
+            if self.resources:
+                await self._release_resources(list(self.resources))
+                self.resources.clear()
+
+    async def _wait_receipt(self, tx_hash):
+        start = time.monotonic()
+        try:
+            if self.replacer and self.replacer.tracked(tx_hash):
+                receipt = await self._wait_or_replace(tx_hash)
+            elif self.tracker:
+                receipt = await self.tracker.wait(tx_hash)
+            else:
+                receipt = await self._poll_receipt(tx_hash)
+        except Exception as e:
+            if self.throttle:
+                self.throttle.observe_error(e)
+            raise
+        latency = time.monotonic() - start
+        if self.throttle:
+            self.throttle.included(latency)
+        self.logger.debug("Receipt %s in %.1fs", tx_hash, latency, extra={'tx_hash': tx_hash, 'latency': latency})
+        return receipt
+
+    def _decode_uint(self, data):
+        return self.web3.codec.decode_single("uint256", bytes(data))
+
+    async def _build_tx(self, _from, to, data, fees, gas=None, value=0):
+        """构造未签名交易, fees 为手续费字段, 未指定 gas 时通过 estimateGas 估算"""
+        if self.chain_id is None:
+            self.chain_id = await self._get_chain_id()
+        tx = {'chainId': self.chain_id, 'from': _from, 'to': to, 'data': data, 'value': value, **fees}
+        tx['gas'] = gas if gas else await self._estimate_gas(tx)
+        return tx
+
+    async def _fee_fields(self, kind):
+        """开启'fee_oracle'时由 oracle 给出手续费, 否则 MultiSend 使用节点 gasPrice, 其他交易使用配置的'gas_price'"""
+        if self.oracle:
+            return await self.oracle.fees()
+        if kind == "multi_send":
+            return {'gasPrice': await self._get_gas_price()}
+        return {'gasPrice': self.config['fees']['gas_price']}
 
-    def multi_send(self, token, addresses, amounts, symbol):
-        contract = self.web3.eth.contract(address=self.config['contracts']['MultiSend'], abi=self._get_abi("MultiSend"))
+    def _gas_limit(self, kind):
+        default = self.config['fees'][f"gas_{kind}"]
+        return self.oracle.gas_limit(kind, default) if self.oracle else default
+
+    def _fee_per_gas(self, tx):
+        return tx.get('maxFeePerGas', tx.get('gasPrice'))
+
+    def _transfer_fee(self, fees):
+        """转出余额时预留的手续费; 未开启'fee_oracle'时使用配置的'fee_transfer'"""
+        if self.oracle:
+            return self._gas_limit("transfer") * self._fee_per_gas(fees)
+        return self.config['fees']['fee_transfer']
+
+    def _report_gas(self):
+        if self.oracle and self.oracle.usage:
+            self.logger.debug(f"Gas usage: {self.oracle.report()}")
+
+    def _paid(self, kind, tx, receipt):
+        """记录 gas 上限与实际消耗, 返回实际支付的手续费"""
+        if self.oracle:
+            self.oracle.record(kind, tx['gas'], receipt['gasUsed'])
+        return receipt['gasUsed'] * (receipt.get('effectiveGasPrice') or self._fee_per_gas(tx))
+
+    async def _next_nonce(self, address):
+        if address in self.nonces:
+            return await self.nonces[address].next()
+        return await self._get_nonce(address)
+
+    async def _journal_begin(self, raw_tx, tx, journal):
+        entry = Journal(txHash=Web3.keccak(raw_tx).hex(), sender=tx['from'], nonce=tx['nonce'], rawTx=Web3.toHex(raw_tx), **journal)
+        await self._run_blocking(entry.save)
+
+    async def _journal_finish(self, tx_hash, status):
+        if self.journal and tx_hash:
+            await self._run_blocking(lambda: Journal.objects(txHash=tx_hash).update(set__status=status))
+
+    async def _sign_and_send(self, tx, key, journal=None, sweep=False):
+        """签名并广播; 传入 journal 且开启'journal'时, 广播前先写入预写日志; sweep 表示交易转出账户全部余额"""
+        raw_tx = self.signer.take(tx)
+        if raw_tx is None:
+            raw_tx = self.web3.eth.account.sign_transaction(tx, key).rawTransaction
+        if journal and self.journal:
+            await self._journal_begin(raw_tx, tx, journal)
+        await self.limiter.acquire()
+        if self.throttle:
+            await self.throttle.wait()
+        try:
+            tx_hash = await self._send_raw(raw_tx)
+        except Exception as e:
+            if self.throttle:
+                self.throttle.observe_error(e)
+            if tx['from'] in self.nonces:
+                # 其他任务可能正在使用该钱包的后续 nonce, 停止分配而不是重新同步
+                self.nonces[tx['from']].halt(e)
+            raise
+        if self.throttle:
+            self.throttle.accepted()
+        if self.replacer:
+            self.replacer.track(tx_hash, tx, key, journal, sweep)
+        return tx_hash
+
+    async def _resend(self, tx, key, journal=None):
+        """以相同 nonce 重新签名广播提高手续费后的交易"""
+        raw_tx = self.web3.eth.account.sign_transaction(tx, key).rawTransaction
+        if journal and self.journal:
+            await self._journal_begin(raw_tx, tx, journal)
+        try:
+            tx_hash = await self._send_raw(raw_tx)
+        except Exception as e:
+            self.logger.warning(f"Replace {tx['from']} nonce {tx['nonce']} error: {e}")
+            raise
+        self.logger.debug("Replace %s nonce %s with %s, gas price %s", tx['from'], tx['nonce'], tx_hash, self._fee_per_gas(tx), extra={'tx_hash': tx_hash})
+        return tx_hash
+
+    async def _wait_or_replace(self, tx_hash):
+        mined, receipt, hashes = await self.replacer.wait(tx_hash)
+        for sent in hashes:
+            if sent != mined:
+                await self._journal_finish(sent, "failed")
+        if mined != tx_hash:
+            self.logger.debug("Transaction %s replaced by %s", tx_hash, mined, extra={'tx_hash': mined})
+        return receipt
+
+    def _receipt_hash(self, receipt):
+        """回执中实际上链的交易哈希, 交易被提价替换后与最初广播的哈希不同"""
+        tx_hash = receipt['transactionHash']
+        return tx_hash if isinstance(tx_hash, str) else Web3.toHex(tx_hash)
+
+    async def _pause(self, interval):
+        """开启'adaptive_throttle'时提交节奏由 throttle 控制, 不再固定等待"""
+        if not self.throttle:
+            await asyncio.sleep(interval)
+
+    def _multi_send_call(self, token, addresses, amounts):
         value = 0
         for item in amounts:
             value += item
-        self.logger.debug(f"Total token: {Web3.fromWei(value,'ether')} {symbol}")
-        if token:
-            tx = contract.functions.multi_send_token(token, addresses, amounts).buildTransaction({
-                "from": self.defaultAccount,
-                "gasPrice": self.web3.eth.gas_price
-            })
-        else:
-            tx = contract.functions.multi_send_token("0x0000000000000000000000000000000000000000", addresses, amounts).buildTransaction({
-                "from": self.defaultAccount,
-                "gasPrice": self.web3.eth.gas_price,
-                "value": value
-            })
-        # gas = self.web3.eth.estimateGas(tx)
-        nonce = self.web3.eth.get_transaction_count(self.defaultAccount)
-        # tx.update({'gas': gas})
-        tx.update({'nonce': nonce})
-        signed_tx = self.web3.eth.account.sign_transaction(tx, self.config['main_account_key'])
-        trx_id = self.web3.eth.send_raw_transaction(signed_tx.rawTransaction)
-        tx_hash = self.web3.toHex(trx_id)
-        result = self.web3.eth.wait_for_transaction_receipt(tx_hash)
+        return encode_call("multi_send_token", token or ZERO_ADDRESS, addresses, amounts), value
+
+    async def _estimate_multi_send(self, token, addresses, amounts, wallet, call=None):
+        data, value = call or self._multi_send_call(token, addresses, amounts)
+        return await self._estimate_gas({'from': wallet['address'], 'to': self.config['contracts']['MultiSend'], 'data': data, 'value': 0 if token else value})
+
+    async def send_multi_send(self, token, addresses, amounts, symbol, gas=None, journal=None, wallet=None, call=None):
+        """从资金钱包(默认主账户)签名并广播一笔 MultiSend 交易, 不等待确认, 返回 (tx_hash, tx); call 为预先编码的 (data, value)"""
+        wallet = wallet or self.wallets[0]
+        data, value = call or self._multi_send_call(token, addresses, amounts)
+        if self.logger.is_enabled():
+            self.logger.debug("Total token: %s %s", Web3.fromWei(value, 'ether'), symbol, extra={'phase': "transfer"})
+        tx = await self._build_tx(wallet['address'],
+                                  self.config['contracts']['MultiSend'],
+                                  data,
+                                  await self._fee_fields("multi_send"),
+                                  gas=gas,
+                                  value=0 if token else value)
+        tx.update({'nonce': await self.nonces[wallet['address']].next()})
+        return await self._sign_and_send(tx, wallet['key'], journal), tx
+
+    async def _confirm_multi_send(self, tx_hash, tx):
+        result = await self._wait_receipt(tx_hash)
         if result and result['status']:
-            self.logger.debug(f"MultiSend hash: {tx_hash}")
+            tx_hash = self._receipt_hash(result)
+            self._paid("multi_send", tx, result)
+            self.logger.debug("MultiSend hash: %s", tx_hash, extra={'tx_hash': tx_hash, 'phase': "transfer"})
+            return tx_hash
         else:
+            await self._journal_finish(tx_hash, "failed")
             raise Exception(f"MultiSend error: {tx_hash} {tx} ==== result: {result}")
 
-    def approve(self, address, amount, target_contract, _from, _from_key):
-        contract = self.web3.eth.contract(address=address, abi=self._get_abi("ERC20"))
-        approved = contract.functions.allowance(_from, target_contract).call()
+    async def multi_send(self, token, addresses, amounts, symbol, gas=None, journal=None, wallet=None, call=None):
+        tx_hash, tx = await self.send_multi_send(token, addresses, amounts, symbol, gas, journal, wallet, call)
+        return await self._confirm_multi_send(tx_hash, tx)
+
+    async def sign_transactions(self, items):
+        """在进程池中批量签名 [(tx, private_key)], 返回可直接广播的 raw 数据"""
+        raws, speed = await self._run_blocking(self.signer.sign, items)
+        self.logger.debug(f"Signed {len(raws)} transactions, {speed:.0f} tx/s")
+        return raws
+
+    async def _approve_tx(self, address, amount, target_contract, _from, nonce=None):
+        data = encode_call("approve", target_contract, amount)
+        tx = await self._build_tx(_from, address, data, await self._fee_fields("approve"), gas=self._gas_limit("approve"))
+        tx.update({'nonce': await self._next_nonce(_from) if nonce is None else nonce})
+        return tx
+
+    async def approve(self, address, amount, target_contract, _from, _from_key, approved=None, nonce=None):
+        """授权, 返回实际支付的手续费(跳过时为 0); approved 和 nonce 可由批量读取预先提供"""
+        if approved is None:
+            approved = self._decode_uint(await self._call(address, encode_call("allowance", _from, target_contract)))
         if approved >= amount:
-            self.logger.debug(f"{target_contract} approveed {Web3.fromWei(amount,'ether')} {self.config['staking_symbol']}, skip operation")
-            return
-        tx = contract.functions.approve(target_contract, amount).buildTransaction({
-            "from": _from,
-            "gasPrice": self.config['fees']['gas_price'],
-            "gas": self.config['fees']['gas_approve']
-        })
-        nonce = self.web3.eth.get_transaction_count(_from)
-        tx.update({'nonce': nonce})
-        self.logger.debug(f"Start approve: {Web3.fromWei(amount,'ether')} {self.config['staking_symbol']} >> {tx}")
-        signed_tx = self.web3.eth.account.sign_transaction(tx, _from_key)
-        trx_id = self.web3.eth.send_raw_transaction(signed_tx.rawTransaction)
-        tx_hash = self.web3.toHex(trx_id)
-        result = self.web3.eth.wait_for_transaction_receipt(tx_hash)
+            self.logger.debug("%s approved %s %s, skip operation", target_contract, Web3.fromWei(amount, 'ether'), self.config['staking_symbol'])
+            return 0
+        tx = await self._approve_tx(address, amount, target_contract, _from, nonce)
+        if self.logger.is_enabled():
+            self.logger.debug("Start approve: %s %s >> %s", Web3.fromWei(amount, 'ether'), self.config['staking_symbol'], tx, extra={'phase': "approve"})
+        tx_hash = await self._sign_and_send(tx, _from_key)
+        result = await self._wait_receipt(tx_hash)
         if result and result['status']:
-            self.logger.debug(f"Approve hash: {tx_hash}")
+            self.logger.debug("Approve hash: %s", self._receipt_hash(result), extra={'tx_hash': self._receipt_hash(result), 'phase': "approve"})
+            return self._paid("approve", tx, result)
         else:
             raise Exception(f"Approve error: {tx_hash} {tx} ==== result: {result}")
 
+    async def _commit_transfer(self, accounts, symbol, tx_hash=None):
+        """按批次的 id 列表一次性记录该币种已分发"""
+        await self._mark_transferred([ac.id for ac in accounts], symbol)
+        await self._journal_finish(tx_hash, "done")
+        await self._release_accounts([ac.id for ac in accounts], f"transfer_{symbol}")
+
+    async def reconcile_journal(self):
+        """启动时批量核对所有未完成的预写日志: 已上链的补写状态, 未上链且 nonce 未被占用的重新广播原交易"""
+        entries = await self._run_blocking(lambda: list(Journal.objects(status="pending").order_by('sender', 'nonce')))
+        if not entries:
+            return
+        self.logger.debug(f"Reconcile {len(entries)} pending journal entries ...")
+        receipts = await self.reader.receipts([entry.txHash for entry in entries])
+        senders = sorted({entry.sender for entry in entries})
+        mined_nonces = dict(zip(senders, await self.reader.nonces(senders, "latest")))
+        waiting = []
+        for entry, receipt in zip(entries, receipts):
+            if receipt:
+                await self._apply_journal(entry, receipt)
+            elif mined_nonces[entry.sender] > entry.nonce:
+                # nonce 已被其他交易占用, 该交易不会再上链
+                await self._journal_finish(entry.txHash, "failed")
+            else:
+                try:
+                    await self._send_raw(entry.rawTx)
+                except Exception as e:
+                    self.logger.debug(f"Rebroadcast {entry.txHash}: {e}")
+                waiting.append(entry)
+        results = await asyncio.gather(*[self._wait_receipt(entry.txHash) for entry in waiting], return_exceptions=True)
+        for entry, receipt in zip(waiting, results):
+            if isinstance(receipt, Exception):
+                # 仍可能上链, 本次运行跳过这些账户以免重复发送
+                self.unresolved_ids.update(entry.accountIds)
+                self.logger.warning(f"Journal {entry.txHash} still unresolved: {receipt}")
+            else:
+                await self._apply_journal(entry, receipt)
+        for manager in self.nonces.values():
+            manager.resync()
+        self.logger.debug(f"Reconciled {len(entries)} journal entries.")
+
+    async def _apply_journal(self, entry, receipt):
+        if receipt['status'] and entry.phase == "transfer":
+            await self._mark_transferred(list(entry.accountIds), entry.changes['transferred'])
+            await self._journal_finish(entry.txHash, "done")
+        elif receipt['status']:
+            await self._update_accounts(list(entry.accountIds), **entry.changes)
+            await self._journal_finish(entry.txHash, "done")
+        else:
+            await self._journal_finish(entry.txHash, "failed")
+
+    async def _calibrate_batch_size(self, token, symbol, accounts, amount, wallet):
+        """用待分发地址估算每个接收地址的 gas 成本, 使每笔 MultiSend 接近区块 gas 上限的'block_gas_fraction'"""
+        sample = [account.address for account in accounts[:self.config.get('calibrate_sample', 10)]]
+        if len(sample) < 2:
+            return self.config['per_request']
+        try:
+            single = await self._estimate_multi_send(token, sample[:1], [amount], wallet)
+            multiple = await self._estimate_multi_send(token, sample, [amount] * len(sample), wallet)
+            gas_limit = await self._get_block_gas_limit()
+        except Exception as e:
+            self.logger.warning(f"Calibrate {symbol} batch size error, use per_request: {e}")
+            return self.config['per_request']
+        per_recipient = max((multiple - single) // (len(sample) - 1), 1)
+        base = single - per_recipient
+        size = max(int((gas_limit * self.config.get('block_gas_fraction', 0.5) - base) // per_recipient), 1)
+        self.logger.debug(f"Calibrated {symbol}: base gas {base}, {per_recipient} gas per recipient, {size} recipients per batch")
+        return size
+
+    async def _distribute_batch(self, pending, wallet, token, addresses, amounts, symbol, accounts, call=None):
+        """提交一批分发; 流水线模式下最多保留'pipeline_depth'笔未确认交易, 确认后再提交进度"""
+        gas = None
+        if self.auto_batch:
+            try:
+                # 估算值随链上状态变化, 按'gas_margin'留出余量作为 gas 上限
+                gas = math.ceil(await self._estimate_multi_send(token, addresses, amounts, wallet, call) * self.config.get('gas_margin', 1.2))
+            except Exception as e:
+                if len(addresses) == 1:
+                    raise
+                half = len(addresses) // 2
+                self.logger.debug(f"Estimate gas for {len(addresses)} addresses failed, split batch: {e}")
+                await self._distribute_batch(pending, wallet, token, addresses[:half], amounts[:half], symbol, accounts[:half])
+                await self._distribute_batch(pending, wallet, token, addresses[half:], amounts[half:], symbol, accounts[half:])
+                return
+        journal = {'phase': "transfer", 'accountIds': [ac.id for ac in accounts], 'recipients': addresses, 'changes': {'transferred': symbol}}
+        if self.pipeline_depth <= 1:
+            tx_hash = await self.multi_send(token, addresses, amounts, symbol, gas, journal, wallet, call)
+            await self._commit_transfer(accounts, symbol, tx_hash)
+            self.logger.debug(f"Successfully distributed {symbol} to {len(addresses)} addresses")
+            await self._pause(self.post_interval)
+            return
+        tx_hash, tx = await self.send_multi_send(token, addresses, amounts, symbol, gas, journal, wallet, call)
+        self.logger.debug("Submitted MultiSend %s for %s addresses, nonce %s",
+                          tx_hash,
+                          len(addresses),
+                          tx['nonce'],
+                          extra={
+                              'tx_hash': tx_hash,
+                              'phase': "transfer"
+                          })
+        confirm = asyncio.ensure_future(self._confirm_multi_send(tx_hash, tx))
+        pending.append((confirm, tx, accounts, symbol))
+        await self._drain_pending(pending, self.pipeline_depth - 1)
+
+    async def _drain_pending(self, pending, limit=0):
+        """按提交顺序等待确认, 直到未确认交易不超过 limit 笔; 有交易失败时停止该钱包的 nonce 分配, 等待并提交其余交易后抛出第一个错误"""
+        error = None
+        while len(pending) > limit:
+            confirm, tx, accounts, symbol = pending.pop(0)
+            try:
+                tx_hash = await confirm
+            except Exception as e:
+                self.nonces[tx['from']].halt(e)
+                error = error or e
+                limit = 0
+                continue
+            await self._commit_transfer(accounts, symbol, tx_hash)
+            self.logger.debug(f"Successfully distributed {symbol} to {len(accounts)} addresses")
+        if error:
+            raise error
+
+    def _amount_range(self, coin):
+        random_range = coin['amount']
+        max_amount = 0
+        min_amount = 0
+        if isinstance(random_range, list) and len(random_range) == 2:
+            max_amount = int(Web3.toWei(random_range[1], "ether"))
+            min_amount = int(Web3.toWei(random_range[0], "ether"))
+        else:
+            max_amount = min_amount = int(Web3.toWei(random_range, "ether"))
+        self.logger.debug(f"Random range: min {max_amount}, max {min_amount}")
+        return min_amount, max_amount
+
+    async def _funding_needs(self, coins, ranges, wallets):
+        """按各钱包分片待分发账户数和金额上限估算所需资金, 返回 {(钱包地址, 币种): 金额}"""
+        limit = self.config['account_count']
+        needs = {}
+        for coin, (_, max_amount) in zip(coins, ranges):
+            for wallet, shard in wallets:
+                count = min(await self._count_transfer_accounts(coin['symbol'], shard), self._shard_limit(limit, shard))
+                needs[(wallet['address'], coin['symbol'])] = count * max_amount
+        return needs
+
+    async def _plan_totals(self, coins, wallets):
+        """按 (资金钱包, 币种) 汇总未完成计划中尚未收到该币种的账户的分发总额
+
+        计划在整个钱包和币种分发结束后才标记完成, 续跑时已提交的账户不计入, 资金只需覆盖剩余部分
+        """
+        totals = {}
+        for wallet in wallets:
+            for coin in coins:
+                symbol = coin['symbol']
+                total = 0
+                last_batch = -1
+                while True:
+                    batches = await self._find_plan(wallet['address'], symbol, last_batch, self.reader.batch_size)
+                    if not batches:
+                        break
+                    last_batch = batches[-1].batch
+                    transferred = await self._find_transferred([id for batch in batches for id in batch.accountIds], symbol)
+                    for batch in batches:
+                        total += sum(int(amount) for id, amount in zip(batch.accountIds, batch.amounts) if id not in transferred)
+                totals[(wallet['address'], symbol)] = total
+        return totals
+
+    async def _check_funding(self, coins, needs, wallets):
+        """检查资金钱包余额是否满足 needs, 不足时在开始前报错"""
+        addresses = [wallet['address'] for wallet in wallets]
+        shortage = []
+        for coin in coins:
+            if coin['address']:
+                balances = await self.reader.token_balances(coin['address'], addresses)
+            else:
+                balances = await self.reader.balances(addresses)
+            for wallet, balance in zip(wallets, balances):
+                need = needs.get((wallet['address'], coin['symbol']), 0)
+                self.logger.debug(
+                    f"Funding wallet {wallet['address']} {coin['symbol']}: need {Web3.fromWei(need, 'ether')}, have {Web3.fromWei(balance, 'ether')}")
+                if balance < need:
+                    shortage.append(f"{wallet['address']} {coin['symbol']} need {Web3.fromWei(need, 'ether')} have {Web3.fromWei(balance, 'ether')}")
+        if shortage:
+            raise Exception(f"Insufficient funding wallet balance: {'; '.join(shortage)}")
+
+    def _shard_limit(self, limit, shard):
+        if shard is None:
+            return limit
+        # id 从 1 开始, 统计 1..limit 中 id % count == remainder 的个数
+        count, remainder = shard
+        return max((limit - remainder) // count + (1 if remainder else 0), 0)
+
     async def _run_transfer(self):
-        """根据配置为所有地址分发代币"""
+        """根据配置为所有地址分发代币; 配置多个'funding_wallets'时按 id 取模分片, 各钱包并行分发"""
         coins = self.config['distribute']
-        accounts = Keys.objects(isTransfer__lt=len(coins)).limit(self.config['account_count'])
-        self.logger.debug(f"Read to {len(accounts)} addresses.")
-        addresses = []
-        amounts = []
-        for index in range(1, len(coins) + 1):
-            coin = coins[index - 1]
-            token = coin['address']
-            symbol = coin['symbol']
-            self.logger.debug(f"distribute token [{symbol}]: {token}")
-            if token:
-                self.approve(token, MAX_WEI, self.config['contracts']['MultiSend'], self.defaultAccount, self.config['main_account_key'])
-                await asyncio.sleep(self.post_interval)
-            random_range = coin['amount']
-            max_amount = 0
-            min_amount = 0
-            if isinstance(random_range, list) and len(random_range) == 2:
-                max_amount = int(Web3.toWei(random_range[1], "ether"))
-                min_amount = int(Web3.toWei(random_range[0], "ether"))
-            else:
-                max_amount = min_amount = int(Web3.toWei(random_range, "ether"))
-            self.logger.debug(f"Random range: min {max_amount}, max {min_amount}")
-            save_accounts = []
-            for account in accounts:
-                if account.isTransfer >= index: continue
-                if min_amount != max_amount:
-                    amount = random.randrange(min_amount, max_amount, int(Web3.toWei(0.5, "ether")))
+        if self.journal:
+            await self.reconcile_journal()
+        await self._migrate_transfer_progress([coin['symbol'] for coin in coins])
+        ranges = []
+        for coin in coins:
+            self.logger.debug(f"distribute token [{coin['symbol']}]: {coin['address']}")
+            ranges.append(self._amount_range(coin))
+        wallets = await self._claim_wallets()
+        if not wallets:
+            self.logger.warning("All funding wallets are held by other workers, nothing to distribute.")
+            return
+        compiled = self.config.get('distribution_plan', False)
+        fresh = wallets
+        needs = {}
+        if compiled:
+            # 计划按钱包编译, 只有持有该钱包的实例会编译或续跑它的计划
+            fresh = []
+            resumed = []
+            for wallet, shard in wallets:
+                if await self._count_plan(wallet['address']):
+                    self.logger.debug(f"Resume pending distribution plan of {wallet['address']}.")
+                    resumed.append(wallet)
                 else:
-                    amount = max_amount
-                amounts.append(amount)
-                addresses.append(account.address)
-                save_accounts.append(account)
-                if len(addresses) == self.config['per_request']:
-                    self.multi_send(token, addresses, amounts, symbol)
-                    for ac in save_accounts:
-                        ac.isTransfer = index
-                        ac.save()
-                    self.logger.debug(f"Successfully distributed {len(addresses)} addresses")
-                    save_accounts = []
-                    addresses = []
-                    amounts = []
-                    await asyncio.sleep(self.post_interval)
-            if len(addresses) > 0:
-                self.multi_send(token, addresses, amounts, symbol)
-                for ac in save_accounts:
-                    ac.isTransfer = index
-                    ac.save()
-                self.logger.debug(f"Successfully distributed {len(addresses)} addresses")
-                save_accounts = []
-                addresses = []
-                amounts = []
-                await asyncio.sleep(self.post_interval)
+                    fresh.append((wallet, shard))
+            needs = await self._plan_totals(coins, resumed)
+        # 尚未编译计划的钱包按金额上限估算; 授权之后再编译, 按 gas 估算批次大小时 MultiSend 已获得代币授权
+        needs.update(await self._funding_needs(coins, ranges, fresh))
+        await self._check_funding(coins, needs, [wallet for wallet, _ in wallets])
+        for coin in coins:
+            if coin['address']:
+                for wallet, _ in wallets:
+                    await self.approve(coin['address'], MAX_WEI, self.config['contracts']['MultiSend'], wallet['address'], wallet['key'])
+                await self._pause(self.post_interval)
+        if compiled:
+            await self._compile_plan(coins, ranges, fresh)
+        # 各币种互不依赖, 同一钱包的各币种分发并行进行, 共用该钱包的 nonce 序列;
+        # 一个任务失败时其余任务继续等待各自已广播的交易并提交进度, 全部结束后再汇总报错
+        if compiled:
+            tasks = [self._send_plan(wallet, coin) for wallet, _ in wallets for coin in coins]
+        else:
+            tasks = [self._transfer_token(wallet, shard, coin, amount_range) for wallet, shard in wallets for coin, amount_range in zip(coins, ranges)]
+        results = await asyncio.gather(*tasks, return_exceptions=True)
+        self._report_gas()
+        errors = [result for result in results if isinstance(result, Exception)]
+        if errors:
+            raise Exception(f"{len(errors)} of {len(results)} distribution tasks failed: {'; '.join(str(e) for e in errors)}") from errors[0]
+
+    async def _transfer_token(self, wallet, shard, coin, amount_range):
+        """由一个资金钱包向其分片内尚未收到该币种的账户分发, 按页流式读取账户"""
+        token, symbol = coin['address'], coin['symbol']
+        min_amount, max_amount = amount_range
+        page_size = await self._batch_size(wallet, shard, token, symbol, max_amount)
+        limit = self._shard_limit(self.config['account_count'], shard)
+        last_id = 0
+        read = 0
+        pending = []
+        try:
+            while read < limit:
+                accounts = await self._find_transfer_accounts(symbol, last_id, min(page_size, limit - read), shard)
+                if not accounts:
+                    break
+                read += len(accounts)
+                last_id = accounts[-1].id
+                accounts = [account for account in accounts if account.id not in self.unresolved_ids]
+                accounts = await self._claim_accounts(accounts, f"transfer_{symbol}", {'transferred': {'$ne': symbol}})
+                if not accounts:
+                    continue
+                amounts = self._draw_amounts(random, len(accounts), min_amount, max_amount)
+                await self._distribute_batch(pending, wallet, token, [account.address for account in accounts], amounts, symbol, accounts)
+            self.logger.debug(f"Wallet {wallet['address']} read to {read} addresses for {symbol}.")
+        finally:
+            await self._drain_pending(pending)
+
+    def _draw_amounts(self, rng, count, min_amount, max_amount):
+        if min_amount == max_amount:
+            return [max_amount] * count
+        return rng.choices(range(min_amount, max_amount, AMOUNT_STEP), k=count)
+
+    def _max_batch_size(self):
+        """每批地址数上限: 'max_batch_size'(0 为不限)和 calldata 不超过'max_calldata_bytes'(节点交易池默认限制 128KB)两者取小"""
+        # multi_send_token(address,address[],uint256[]) 的 calldata 为 4 + 5 * 32 字节, 每个接收地址再增加 64 字节
+        size = max((self.config.get('max_calldata_bytes', 120000) - 4 - 5 * 32) // 64, 1)
+        if self.config.get('max_batch_size'):
+            size = min(size, self.config['max_batch_size'])
+        return size
+
+    async def _batch_size(self, wallet, shard, token, symbol, max_amount):
+        if not self.auto_batch:
+            return min(self.config['per_request'], self._max_batch_size())
+        sample = await self._find_transfer_accounts(symbol, 0, self.config.get('calibrate_sample', 10), shard)
+        return min(await self._calibrate_batch_size(token, symbol, sample, max_amount, wallet), self._max_batch_size())
+
+    async def _compile_plan(self, coins, ranges, wallets):
+        """为每个资金钱包和币种按批次读取账户、生成金额并预先编码 MultiSend calldata, 每'plan_chunk'批写入一次 Plan 供发送阶段流式读取
+
+        金额由计划中记录的种子('plan_seed', 未配置时随机生成)决定, 相同种子和账户得到相同的计划; 编译时内存占用与账户总数无关
+        """
+        seed = self.config.get('plan_seed') or random.getrandbits(31)
+        chunk = self.config.get('plan_chunk', 100)
+        for wallet, shard in wallets:
+            limit = self._shard_limit(self.config['account_count'], shard)
+            for coin, (min_amount, max_amount) in zip(coins, ranges):
+                token, symbol = coin['address'], coin['symbol']
+                rng = random.Random(f"{seed}:{wallet['address']}:{symbol}")
+                batch_size = await self._batch_size(wallet, shard, token, symbol, max_amount)
+                last_id = 0
+                read = 0
+                batch = 0
+                count = 0
+                total = 0
+                docs = []
+                while read < limit:
+                    page = await self._find_transfer_accounts(symbol, last_id, min(batch_size, limit - read), shard)
+                    if not page:
+                        break
+                    read += len(page)
+                    last_id = page[-1].id
+                    accounts = [account for account in page if account.id not in self.unresolved_ids]
+                    if not accounts:
+                        continue
+                    amounts = self._draw_amounts(rng, len(accounts), min_amount, max_amount)
+                    addresses = [account.address for account in accounts]
+                    data, value = self._multi_send_call(token, addresses, amounts)
+                    docs.append({
+                        "wallet": wallet['address'],
+                        "symbol": symbol,
+                        "token": token,
+                        "seed": seed,
+                        "batch": batch,
+                        "accountIds": [account.id for account in accounts],
+                        "recipients": addresses,
+                        "amounts": [str(amount) for amount in amounts],
+                        "data": data,
+                        "value": str(value),
+                        "status": "pending"
+                    })
+                    batch += 1
+                    count += len(accounts)
+                    total += value
+                    if len(docs) >= chunk:
+                        await self._insert_plan(docs)
+                        docs = []
+                if docs:
+                    await self._insert_plan(docs)
+                if batch:
+                    self.logger.debug(f"Compiled {symbol} plan for {wallet['address']}: {count} addresses in {batch} batches, "
+                                      f"total {Web3.fromWei(total, 'ether')} {symbol}, seed {seed}")
+
+    async def _send_plan(self, wallet, coin):
+        """按批次顺序流式读取该钱包和币种的计划并发送; 批次中已记录该币种的账户剔除后重新编码"""
+        token, symbol = coin['address'], coin['symbol']
+        last_batch = -1
+        pending = []
+        try:
+            while True:
+                batches = await self._find_plan(wallet['address'], symbol, last_batch, self.reader.batch_size)
+                if not batches:
+                    break
+                last_batch = batches[-1].batch
+                for batch in batches:
+                    skip = await self._find_transferred(list(batch.accountIds), symbol) | self.unresolved_ids
+                    keep = [i for i, id in enumerate(batch.accountIds) if id not in skip]
+                    if not keep:
+                        continue
+                    accounts = [Keys(id=batch.accountIds[i], address=batch.recipients[i]) for i in keep]
+                    claimed = {account.id for account in await self._claim_accounts(accounts, f"transfer_{symbol}", {'transferred': {'$ne': symbol}})}
+                    keep = [i for i in keep if batch.accountIds[i] in claimed]
+                    if not keep:
+                        continue
+                    accounts = [account for account in accounts if account.id in claimed]
+                    amounts = [int(batch.amounts[i]) for i in keep]
+                    call = (batch.data, int(batch.value)) if len(keep) == len(batch.accountIds) else None
+                    await self._distribute_batch(pending, wallet, token, [account.address for account in accounts], amounts, symbol, accounts, call)
+        finally:
+            await self._drain_pending(pending)
+        await self._finish_plan(wallet['address'], symbol)
+        self.logger.debug(f"Wallet {wallet['address']} finished {symbol} plan.")
 
     def get_run_transfer_tasks(self, loop: asyncio.AbstractEventLoop):
-        return [loop.create_task(self._run_transfer())]
+        return [loop.create_task(self._with_leases(self._run_transfer()))]
 
     def _get_staking_address(self):
         coins = self.config['distribute']
@@ -150,89 +899,304 @@ class Server:
                 return coin['address']
         return None
 
-    async def _send_next(self, account):
-        balance = self.web3.eth.get_balance(account.address)
-        fee = self.config['fees']['fee_transfer']
+    async def _read_staking_state(self, accounts):
+        """批量读取一组账户的质押代币余额、授权额度、BNB 余额和 nonce, 返回 {id: state}"""
+        token = self._get_staking_address()
+        addresses = [account.address for account in accounts]
+        tokens, allowances, balances, nonces = await asyncio.gather(self.reader.token_balances(token, addresses),
+                                                                    self.reader.allowances(token, addresses, self.config['contracts']['ERC20Staking']),
+                                                                    self.reader.balances(addresses), self.reader.nonces(addresses))
+        return {account.id: {'token': tokens[i], 'allowance': allowances[i], 'balance': balances[i], 'nonce': nonces[i]} for i, account in enumerate(accounts)}
+
+    async def _send_next(self, account, balance=None, nonce=None, to=None):
+        if balance is None:
+            balance = await self._get_balance(account.address)
+        fees = await self._fee_fields("transfer")
+        fee = self._transfer_fee(fees)
         if balance > fee:
-            next_account = Keys.objects(id=account.id + 1).first()
+            tx = await self._forward_tx(account, balance - fee, await self._get_nonce(account.address) if nonce is None else nonce, to, fees)
+            self.logger.debug("Start send balance: %s", tx, extra={'account_id': account.id, 'phase': "forward"})
+            tx_hash = await self._sign_and_send(tx, self._account_key(account), sweep=True)
+            result = await self._wait_receipt(tx_hash)
+            if result and result['status']:
+                self._paid("transfer", tx, result)
+                self.logger.debug("Send balance hash: %s",
+                                  self._receipt_hash(result),
+                                  extra={
+                                      'tx_hash': self._receipt_hash(result),
+                                      'account_id': account.id,
+                                      'phase': "forward"
+                                  })
+            else:
+                raise Exception(f"Send balance error: {tx_hash} {tx} ====== result: {result}")
+
+    async def _forward_tx(self, account, value, nonce, to=None, fees=None):
+        if to is None:
+            next_account = await self._find_account(account.id + 1)
             if not next_account:
                 to = self.defaultAccount
             else:
                 to = next_account.address
-            nonce = self.web3.eth.get_transaction_count(account.address)
-            tx = {
-                'to': to,
-                'from': account.address,
-                'value': balance - fee,
-                'gas': self.config['fees']['gas_transfer'],
-                'gasPrice': self.config['fees']['gas_price'],
-                'nonce': nonce
-            }
-            self.logger.debug(f"Start send balance: {tx}")
-            signed_tx = self.web3.eth.account.sign_transaction(tx, account.privateKey)
-            tx_hash = self.web3.eth.send_raw_transaction(signed_tx.rawTransaction)
-            result = self.web3.eth.wait_for_transaction_receipt(tx_hash)
-            if result and result['status']:
-                self.logger.debug(f"Send balance hash: {self.web3.toHex(tx_hash)}")
-            else:
-                raise Exception(f"Send balance error: {tx_hash} {tx} ====== result: {result}")
+        tx = await self._build_tx(account.address, to, b"", fees or await self._fee_fields("transfer"), gas=self._gas_limit("transfer"), value=value)
+        tx.update({'nonce': nonce})
+        return tx
+
+    async def _deposit_tx(self, account, balance, nonce):
+        data = encode_call("deposit", balance)
+        tx = await self._build_tx(account.address,
+                                  self.config['contracts']['ERC20Staking'],
+                                  data,
+                                  await self._fee_fields("deposit"),
+                                  gas=self._gas_limit("deposit"))
+        tx.update({'nonce': nonce})
+        return tx
+
+    async def _presign_staking(self, accounts, states):
+        """按预读的 nonce 预先构造并批量签名每个账户的 approve 和 deposit 交易"""
+        token = self._get_staking_address()
+        staking = self.config['contracts']['ERC20Staking']
+        items = []
+        for account in accounts:
+            state = states[account.id]
+            nonce = state['nonce']
+            if state['allowance'] < state['token']:
+                items.append((await self._approve_tx(token, state['token'], staking, account.address, nonce), self._account_key(account)))
+                nonce += 1
+            items.append((await self._deposit_tx(account, state['token'], nonce), self._account_key(account)))
+        await self.sign_transactions(items)
 
-    async def _staking(self, account):
+    async def _staking(self, account, state=None):
         address = self._get_staking_address()
         if not address:
             return
-        erc20 = self.web3.eth.contract(address=address, abi=self._get_abi("ERC20"))
-        contract = self.web3.eth.contract(address=self.config['contracts']['ERC20Staking'], abi=self._get_abi("ERC20Staking"))
-        balance = erc20.functions.balanceOf(account.address).call()
-        self.approve(erc20.address, balance, contract.address, account.address, account.privateKey)
-        await asyncio.sleep(self.post_interval)
-        tx = contract.functions.deposit(balance).buildTransaction({
-            "from": account.address,
-            # "gasPrice": self.web3.eth.gas_price
-            "gasPrice": self.config['fees']['gas_price'],
-            "gas": self.config['fees']['gas_deposit']
-            # 'maxFeePerGas': 2000000000,
-            # 'maxPriorityFeePerGas': 1000000000
-        })
-        # gas = self.web3.eth.estimateGas(tx)
-        # gas = contract.functions.deposit(balance).estimateGas()
-        nonce = self.web3.eth.get_transaction_count(account.address)
-        # tx.update({'gas': gas})
-        tx.update({'nonce': nonce})
-        self.logger.debug(f"Start staking: {Web3.fromWei(balance,'ether')} {self.config['staking_symbol']} >> {tx}")
-        signed_tx = self.web3.eth.account.sign_transaction(tx, account.privateKey)
-        trx_id = self.web3.eth.send_raw_transaction(signed_tx.rawTransaction)
-        tx_hash = self.web3.toHex(trx_id)
-        result = self.web3.eth.wait_for_transaction_receipt(tx_hash)
+        if state is None:
+            state = (await self._read_staking_state([account]))[account.id]
+        staking = self.config['contracts']['ERC20Staking']
+        balance = state['token']
+        nonce = state['nonce']
+        paid = 0
+        # 按预读的授权额度判断是否发送 approve, 手续费可能为 0(如本地开发链), 不能据此判断
+        if state['allowance'] < balance:
+            paid = await self.approve(address, balance, staking, account.address, self._account_key(account), approved=state['allowance'], nonce=nonce)
+            nonce += 1
+            await self._pause(self.post_interval)
+        tx = await self._deposit_tx(account, balance, nonce)
+        if self.logger.is_enabled():
+            self.logger.debug("Start staking: %s %s >> %s",
+                              Web3.fromWei(balance, 'ether'),
+                              self.config['staking_symbol'],
+                              tx,
+                              extra={
+                                  'account_id': account.id,
+                                  'phase': "deposit"
+                              })
+        journal = {'phase': "staking", 'accountIds': [account.id], 'recipients': [account.address], 'changes': {'isMortgage': True}}
+        tx_hash = await self._sign_and_send(tx, self._account_key(account), journal)
+        result = await self._wait_receipt(tx_hash)
         if result and result['status']:
-            self.logger.debug(f"Staking hash: {tx_hash}")
+            tx_hash = self._receipt_hash(result)
+            paid += self._paid("deposit", tx, result)
+            self.logger.debug("Staking hash: %s", tx_hash, extra={'tx_hash': tx_hash, 'account_id': account.id, 'phase': "deposit"})
             account.isMortgage = True
-            account.save()
-            await asyncio.sleep(self.post_interval)
-            await self._send_next(account)
+            await self._update_accounts([account.id], isMortgage=True)
+            await self._journal_finish(tx_hash, "done")
+            if self.config.get('staking_forward', True):
+                await self._pause(self.post_interval)
+                # 剩余 BNB 由预读余额减去两笔交易实际消耗的手续费得到, 无需再次查询
+                await self._send_next(account, balance=state['balance'] - paid, nonce=nonce + 1)
         else:
+            await self._journal_finish(tx_hash, "failed")
             raise Exception(f"Deposit error: {tx_hash} {tx} ===== result: {result}")
 
-    async def _run_staking(self):
-        """根据配置质押"""
+    async def _staking_chain(self, account, state):
+        """以连续 nonce 依次广播 approve 和 deposit, 统一等待确认后再转发余额; 任一步失败时按最新状态回退到逐笔模式
+
+        deposit 失败时 nonce 仍被消耗, 若同时链式广播转发交易, 余额会被转走导致回退无法支付手续费, 因此转发只在 deposit 成功后发送
+        """
+        address = self._get_staking_address()
+        if not address:
+            return
+        staking = self.config['contracts']['ERC20Staking']
+        balance = state['token']
+        nonce = state['nonce']
+        chain = []
+        if state['allowance'] < balance:
+            chain.append(("approve", await self._approve_tx(address, balance, staking, account.address, nonce)))
+            nonce += 1
+        chain.append(("deposit", await self._deposit_tx(account, balance, nonce)))
+        journal = {'phase': "staking", 'accountIds': [account.id], 'recipients': [account.address], 'changes': {'isMortgage': True}}
+        hashes = []
+        try:
+            for step, tx in chain:
+                hashes.append(await self._sign_and_send(tx, self._account_key(account), journal if step == "deposit" else None))
+        except Exception as e:
+            # 已广播的交易仍可能上链, 先等待它们的结果再回退
+            self.logger.warning(f"Chained staking {account.id} stopped at {chain[len(hashes)][0]}: {e}")
+        if self.logger.is_enabled():
+            self.logger.debug("Chained staking %s: %s %s >> %s",
+                              account.id,
+                              Web3.fromWei(balance, 'ether'),
+                              self.config['staking_symbol'],
+                              hashes,
+                              extra={
+                                  'account_id': account.id,
+                                  'phase': "deposit"
+                              })
+        results = await asyncio.gather(*[self._wait_receipt(tx_hash) for tx_hash in hashes], return_exceptions=True)
+        succeeded = {step: not isinstance(result, Exception) and bool(result) and bool(result['status']) for (step, _), result in zip(chain, results)}
+        # 已上链的交易无论成功与否都支付了手续费
+        paid = sum(self._paid(step, tx, result) for (step, tx), result in zip(chain, results) if result and not isinstance(result, Exception))
+        deposit_hash = dict(zip([step for step, _ in chain], hashes)).get("deposit")
+        if succeeded.get("deposit"):
+            deposit_hash = self._receipt_hash(results[[step for step, _ in chain].index("deposit")])
+            self.logger.debug("Staking hash: %s", deposit_hash, extra={'tx_hash': deposit_hash, 'account_id': account.id, 'phase': "deposit"})
+            account.isMortgage = True
+            await self._update_accounts([account.id], isMortgage=True)
+            await self._journal_finish(deposit_hash, "done")
+            if self.config.get('staking_forward', True):
+                await self._send_next(account, balance=state['balance'] - paid, nonce=nonce + 1)
+            return
+        await self._journal_finish(deposit_hash, "failed")
+        self.logger.warning(f"Chained staking {account.id} failed: {succeeded}, fall back to sequential staking")
+        await self._staking(account)
+
+    def _staking_query(self):
+        return {'isTransfer': len(self.config['distribute']), 'isMortgage': False}
+
+    async def _staking_worker(self, queue: asyncio.Queue, failed: list):
         staking_interval = self.config['staking_interval']
         while True:
+            account, state = await queue.get()
             try:
-                account = Keys.objects(isTransfer=len(self.config['distribute']), isMortgage=False).first()
-                if account:
-                    await self._staking(account)
-                else:
-                    self.logger.debug("Staking complete.")
+                if account is None:
                     break
-                await asyncio.sleep(staking_interval)
+                # 排队期间租约可能过期, 处理前续租, 已被其他实例接手的账户跳过
+                if not await self._claim_accounts([account], "staking", self._staking_query()):
+                    continue
+                if self.config.get('staking_chain'):
+                    await self._staking_chain(account, state)
+                else:
+                    await self._staking(account, state)
+                await self._pause(staking_interval)
             except Exception as e:
+                failed.append(account.id)
                 self.logger.exception(f"Staking error: {e}")
+            finally:
+                if account is not None:
+                    await self._release_accounts([account.id], "staking")
+                queue.task_done()
+
+    async def _run_staking(self):
+        """根据配置质押, 由'staking_concurrency'个 worker 并发处理不同账户"""
+        if not self._get_staking_address():
+            self.logger.debug(f"Staking token {self.config['staking_symbol']} is not in distribute, skip staking.")
+            return
+        if self.journal:
+            await self.reconcile_journal()
+        concurrency = self.config.get('staking_concurrency', 1)
+        coin_count = len(self.config['distribute'])
+        queue = asyncio.Queue(maxsize=concurrency)
+        failed = []
+        workers = [asyncio.ensure_future(self._staking_worker(queue, failed)) for _ in range(concurrency)]
+        try:
+            while True:
+                last_id = 0
+                while True:
+                    try:
+                        accounts = await self._find_staking_accounts(coin_count, last_id, self.reader.batch_size)
+                        if not accounts:
+                            break
+                        page_last_id = accounts[-1].id
+                        accounts = [account for account in accounts if account.id not in self.unresolved_ids]
+                        accounts = await self._claim_accounts(accounts, "staking", self._staking_query())
+                        states = await self._read_staking_state(accounts) if accounts else {}
+                        if accounts and self.config.get('presign'):
+                            await self._presign_staking(accounts, states)
+                    except Exception as e:
+                        # 读取或租用一页失败时等待后重试该页, 不中断整个质押过程
+                        self.logger.exception(f"Staking read error: {e}")
+                        await self._pause(self.config['staking_interval'])
+                        continue
+                    last_id = page_last_id
+                    for account in accounts:
+                        await queue.put((account, states[account.id]))
+                await queue.join()
+                if not failed:
+                    self._report_gas()
+                    self.logger.debug("Staking complete.")
+                    break
+                self.logger.debug(f"Retry {len(failed)} failed accounts.")
+                failed.clear()
+                await self._pause(self.config['staking_interval'])
+        finally:
+            for _ in workers:
+                await queue.put((None, None))
+            await asyncio.gather(*workers)
+            self.signer.close()
 
     def get_run_staking_tasks(self, loop: asyncio.AbstractEventLoop):
-        return [loop.create_task(self._run_staking())]
+        return [loop.create_task(self._with_leases(self._run_staking()))]
+
+    async def _sweep_level(self, accounts, targets):
+        """批量读取余额和 nonce 后, 并发地把每个账户的剩余 BNB 转给对应的目标地址"""
+        for i in range(0, len(accounts), self.reader.batch_size):
+            page = accounts[i:i + self.reader.batch_size]
+            addresses = [account.address for account in page]
+            balances, nonces = await asyncio.gather(self.reader.balances(addresses), self.reader.nonces(addresses))
+            sends = [self._send_next(account, balance=balances[j], nonce=nonces[j], to=targets[i + j]) for j, account in enumerate(page)]
+            results = await asyncio.gather(*sends, return_exceptions=True)
+            for account, result in zip(page, results):
+                if isinstance(result, Exception):
+                    self.logger.error(f"Sweep {account.id} {account.address} error: {result}")
+
+    async def _run_sweep(self):
+        """并发归集已质押账户的剩余 BNB
+
+        'sweep_fan_in' 为 0 时所有账户直接转入'sweep_sink'(默认主账户), 只需一跳;
+        否则按堆序组成 fan_in 叉归集树, 自底向上逐层并发转账, 共 O(log N) 跳
+        """
+        sink = self.config.get('sweep_sink') or self.defaultAccount
+        fan_in = self.config.get('sweep_fan_in', 0)
+        page_size = self.reader.batch_size
+        last_id = 0
+        if fan_in < 2:
+            while True:
+                accounts = await self._find_sweep_accounts(last_id, page_size)
+                if not accounts:
+                    break
+                last_id = accounts[-1].id
+                await self._sweep_level(accounts, [sink] * len(accounts))
+            self.logger.debug("Sweep complete.")
+            return
+        accounts = []
+        while True:
+            page = await self._find_sweep_accounts(last_id, page_size)
+            if not page:
+                break
+            last_id = page[-1].id
+            accounts.extend(page)
+        # 预先计算每个位置的下一跳地址: 位置 p 的父节点为 (p - 1) // fan_in, 根节点转入 sink
+        targets = [sink] + [accounts[(p - 1) // fan_in].address for p in range(1, len(accounts))]
+        levels = []
+        start = 0
+        width = 1
+        while start < len(accounts):
+            levels.append((start, min(start + width, len(accounts))))
+            start += width
+            width *= fan_in
+        self.logger.debug(f"Sweep {len(accounts)} accounts through {len(levels)} levels.")
+        for start, end in reversed(levels):
+            await self._sweep_level(accounts[start:end], targets[start:end])
+        self.logger.debug("Sweep complete.")
+
+    def get_run_sweep_tasks(self, loop: asyncio.AbstractEventLoop):
+        return [loop.create_task(self._run_sweep())]
 
     def generate_address(self):
         """生成配置文件'account_count'中指定的数量地址"""
+        if self.hd_seed:
+            # 派生地址只需计算, 直接按 id 批量派生写入
+            return self.generate_address_bulk()
         count = self.config['account_count']
         self.logger.debug(f"Start generating addresses: {count} ...")
         try:
@@ -247,17 +1211,107 @@ class Server:
         except Exception as e:
             self.logger.exception(f"generate address error: {e}")
 
+    def generate_address_bulk(self):
+        """多进程生成'account_count'数量的地址, 分块批量写入数据库, 中断后重新执行即可续跑
+
+        配置'hd_mnemonic'时按'{hd_path}/{id}'派生地址, 预先分配 id, 数据库中不保存私钥
+        """
+        count = self.config['account_count']
+        chunk = self.config.get('generate_chunk', 5000)
+        workers = self.config.get('generate_workers') or os.cpu_count()
+        existing = Keys.objects.count()
+        remain = count - existing
+        if remain <= 0:
+            self.logger.debug(f"Already have {existing} addresses, skip generating.")
+            return
+        Keys.sync_sequence()
+        self.logger.debug(f"Start generating addresses: {remain} of {count} with {workers} workers ...")
+        collection = Keys._get_collection()
+        if self.hd_seed:
+            first_id = Keys.allocate_ids(remain)
+            jobs = [(self.hd_seed, self.hd_path, first_id + offset, min(chunk, remain - offset)) for offset in range(0, remain, chunk)]
+        else:
+            jobs = [(existing + offset, min(chunk, remain - offset)) for offset in range(0, remain, chunk)]
+        generated = 0
+        start = time.time()
+        try:
+            with ProcessPoolExecutor(max_workers=workers) as pool:
+                for job, keys in zip(jobs, pool.map(keygen.derive_addresses if self.hd_seed else keygen.create_keys, jobs)):
+                    if self.hd_seed:
+                        docs = [self._key_doc(job[2] + i, address) for i, address in enumerate(keys)]
+                    else:
+                        first_id = Keys.allocate_ids(len(keys))
+                        docs = [self._key_doc(first_id + i, address, private_key) for i, (address, private_key) in enumerate(keys)]
+                    collection.insert_many(docs, ordered=False)
+                    generated += len(docs)
+                    elapsed = time.time() - start
+                    self.logger.debug(f"Generated {existing + generated}/{count} addresses, {generated / elapsed:.0f} keys/s")
+            self.logger.debug(f"Total of {generated} addresses were generated in {time.time() - start:.1f}s.")
+        except Exception as e:
+            self.logger.exception(f"generate address error: {e}")
+
+    def _key_doc(self, id, address, private_key=None):
+        doc = {"_id": id, "address": address, "isTransfer": 0, "transferred": [], "isMortgage": False}
+        if private_key:
+            doc["privateKey"] = private_key
+        return doc
+
     def drop_data(self):
         """从数据库中删除所有已经生成的数据"""
         count = Keys.objects.count()
         self.db_data.drop_database(self.config['mongo']['db'])
         self.logger.debug(f"Successfully cleaned {count} addresses.")
 
-    def export_data(self, path: str):
-        """导出数据到指定'path'文件中"""
-        data = Keys.objects().to_json()
-        with open(path, "w") as file:
-            file.write(data)
+    def export_data(self, path: str, fmt=None, fields=None, compress=None, is_transfer=None, is_mortgage=None):
+        """按游标分批流式导出数据到指定'path'文件中, 内存占用与集合大小无关
+
+        fmt 为 'ndjson' 或 'csv'(默认按扩展名), fields 为导出的字段, '.gz'扩展名或 compress 开启 gzip 压缩,
+        is_transfer / is_mortgage 按对应字段过滤
+        """
+        fmt = fmt or exporter.detect_format(path)
+        fields = tuple(fields or exporter.FIELDS)
+        query = {}
+        if is_transfer is not None:
+            query['isTransfer'] = is_transfer
+        if is_mortgage is not None:
+            query['isMortgage'] = is_mortgage
+        chunk = self.config.get('export_chunk', 5000)
+        cursor = Keys._get_collection().find(query, {field: 1 for field in fields}).sort('_id', 1).batch_size(chunk)
+        count = 0
+        with exporter.open_text(path, "w", compress) as file:
+            writer = exporter.Writer(file, fmt, fields)
+            for doc in cursor:
+                writer.write(doc)
+                count += 1
+                if count % chunk == 0:
+                    self.logger.debug(f"Exported {count} addresses ...")
+        self.logger.debug(f"Exported {count} addresses to {path}.")
+
+    def import_data(self, path: str, fmt=None, compress=None):
+        """流式读取 export_data 导出的文件, 分块批量写入数据库; 已存在的 id 跳过"""
+        fmt = fmt or exporter.detect_format(path)
+        chunk = self.config.get('export_chunk', 5000)
+        collection = Keys._get_collection()
+        count = 0
+        docs = []
+        with exporter.open_text(path, "r", compress) as file:
+            for doc in exporter.read(file, fmt):
+                if '_id' not in doc:
+                    raise Exception(f"Import {path} error: missing '_id' field, export with all fields to import")
+                docs.append(doc)
+                if len(docs) >= chunk:
+                    count += self._insert_keys(collection, docs)
+                    docs = []
+            if docs:
+                count += self._insert_keys(collection, docs)
+        Keys.sync_sequence()
+        self.logger.debug(f"Imported {count} addresses from {path}.")
+
+    def _insert_keys(self, collection, docs):
+        try:
+            return len(collection.insert_many(docs, ordered=False).inserted_ids)
+        except BulkWriteError as e:
+            return e.details['nInserted']
 
     def run_transfer(self):
         """根据配置为所有地址分发代币"""
@@ -269,4 +1323,10 @@ class Server:
         """根据配置质押"""
         loop = asyncio.get_event_loop()
         loop.run_until_complete(asyncio.wait(self.get_run_staking_tasks(loop)))
-        loop.close()
\ No newline at end of file
+        loop.close()
+
+    def run_sweep(self):
+        """归集已质押账户的剩余 BNB"""
+        loop = asyncio.get_event_loop()
+        loop.run_until_complete(asyncio.wait(self.get_run_sweep_tasks(loop)))
+        loop.close()
@@ -0,0 +1,48 @@
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from eth_account import Account
+
+
+def sign_batch(items):
+    """在子进程中签名一批 (tx, private_key), 返回 rawTransaction 列表"""
+    return [bytes(Account.sign_transaction(tx, key).rawTransaction) for tx, key in items]
+
+
+class BulkSigner:
+    """在进程池中批量离线签名交易
+
+    签名结果按 (from, nonce) 缓存, 发送时若待发交易与预签名交易完全一致则直接使用 raw 数据
+    """
+
+    def __init__(self, workers=None, chunk=200) -> None:
+        self.workers = workers or os.cpu_count()
+        self.chunk = chunk
+        self.signed = {}
+        self._pool = None
+
+    def sign(self, items):
+        """items 为 [(tx, private_key)], 返回 (raw 列表, 每秒签名数)"""
+        if not items:
+            return [], 0
+        if self._pool is None:
+            self._pool = ProcessPoolExecutor(max_workers=self.workers)
+        start = time.time()
+        jobs = [items[i:i + self.chunk] for i in range(0, len(items), self.chunk)]
+        raws = [raw for batch in self._pool.map(sign_batch, jobs) for raw in batch]
+        for (tx, _), raw in zip(items, raws):
+            self.signed[(tx['from'], tx['nonce'])] = (tx, raw)
+        return raws, len(raws) / max(time.time() - start, 1e-6)
+
+    def take(self, tx):
+        item = self.signed.pop((tx['from'], tx['nonce']), None)
+        if item and item[0] == tx:
+            return item[1]
+        return None
+
+    def close(self):
+        if self._pool is not None:
+            self._pool.shutdown()
+            self._pool = None
+        self.signed.clear()
@@ -0,0 +1,78 @@
+import asyncio
+import time
+
+
+class BlockRateLimiter:
+    """全局限制每个出块时间窗口内的交易提交数量, limit 为 0 时不限制"""
+
+    def __init__(self, limit, block_time) -> None:
+        self.limit = limit
+        self.block_time = block_time
+        self._lock = asyncio.Lock()
+        self._window_start = 0
+        self._count = 0
+
+    async def acquire(self):
+        if not self.limit:
+            return
+        async with self._lock:
+            now = time.monotonic()
+            if now - self._window_start >= self.block_time:
+                self._window_start = now
+                self._count = 0
+            if self._count >= self.limit:
+                await asyncio.sleep(self._window_start + self.block_time - now)
+                self._window_start = time.monotonic()
+                self._count = 0
+            self._count += 1
+
+
+# 节点过载或提交过快时返回的错误特征
+BACKOFF_ERRORS = ("429", "too many requests", "rate limit", "replacement transaction underpriced", "nonce too low", "nonce too high", "already known",
+                  "known transaction", "txpool is full", "timed out", "not in the chain")
+
+
+class AdaptiveThrottle:
+    """按节点反馈自适应调整提交间隔(AIMD): 交易被接受且及时上链时逐步缩短间隔, 遇到限流、nonce 错误或上链变慢时成倍退避
+
+    max_rate 为每秒提交数的硬上限, 间隔不会低于 1 / max_rate, 也不会超过 max_interval
+    """
+
+    def __init__(self, interval, max_rate, max_interval, target_latency, speedup=0.9, slowdown=2) -> None:
+        self.min_interval = 1 / max_rate if max_rate else 0
+        self.max_interval = max_interval
+        self.interval = min(max(interval, self.min_interval), max_interval)
+        self.target_latency = target_latency
+        self.speedup = speedup
+        self.slowdown = slowdown
+        self.submitted = 0
+        self.backoffs = 0
+        self._lock = asyncio.Lock()
+        self._last = 0
+
+    async def wait(self):
+        async with self._lock:
+            delay = self._last + self.interval - time.monotonic()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            self._last = time.monotonic()
+            self.submitted += 1
+
+    def accepted(self):
+        self.interval = max(self.min_interval, self.interval * self.speedup)
+
+    def included(self, latency):
+        if latency > self.target_latency:
+            self.backoff()
+
+    def backoff(self):
+        self.backoffs += 1
+        self.interval = min(self.max_interval, max(self.interval * self.slowdown, self.min_interval, 0.1))
+
+    def observe_error(self, error):
+        """遇到限流类错误时退避, 返回是否识别为限流类错误"""
+        message = str(error).lower()
+        if any(pattern in message for pattern in BACKOFF_ERRORS):
+            self.backoff()
+            return True
+        return False
@@ -0,0 +1,72 @@
+import mongoengine
+import pytest
+from mongomock import filtering
+
+from create_account.server import Server
+
+# mongomock 未实现 $mod, 多个资金钱包按 id 取模分片时需要
+filtering._filterer_inst._operator_map.setdefault('$mod', lambda doc_val, search_val: isinstance(doc_val, int) and doc_val % search_val[0] == search_val[1])
+
+
+def make_config(**overrides):
+    config = {
+        "chain_rpc": "http://127.0.0.1:1/",
+        "account_count": 500,
+        "per_request": 200,
+        "post_interval": 0,
+        "staking_interval": 0,
+        "staking_symbol": "PNUT",
+        "main_account": "0x145F356161c7F698f13d7d4C9f4395176a4fC4AA",
+        "main_account_key": "0x" + "11" * 32,
+        "contracts": {
+            "MultiSend": "0xa0613b63C30758485A2ecd3382Cd253707419bd7",
+            "ERC20Staking": "0x25108c0d83Ee16b81f63B49F0F37933cFC8ea0b2"
+        },
+        "fees": {
+            "fee_transfer": 105000000000000,
+            "gas_price": 5000000000,
+            "gas_transfer": 21000,
+            "gas_approve": 44284,
+            "gas_deposit": 234482
+        },
+        "distribute": [{
+            "symbol": "BNB",
+            "amount": 0.0013,
+            "address": ""
+        }, {
+            "symbol": "PNUT",
+            "amount": [3, 10],
+            "address": "0x705931A83C9b22fB29985f28Aee3337Aa10EFE11"
+        }],
+        "mongo": {
+            "host": "mongomock://localhost",
+            "db": "account_db_test"
+        }
+    }
+    config.update(overrides)
+    return config
+
+
+@pytest.fixture
+def make_server(tmp_path, monkeypatch):
+    """在 mongomock 上创建 Server, 日志写入临时目录"""
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / "logs").mkdir()
+    servers = []
+
+    def make(**overrides):
+        server = Server(make_config(**overrides))
+        servers.append(server)
+        return server
+
+    yield make
+    for server in servers:
+        server.logger.logger.handlers.clear()
+    if servers:
+        servers[0].db_data.drop_database("account_db_test")
+    mongoengine.disconnect()
+
+
+@pytest.fixture
+def server(make_server):
+    return make_server()
@@ -0,0 +1,191 @@
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import rlp
+from eth_account import Account
+from eth_utils import keccak
+
+SELECTOR_BALANCE_OF = "0x70a08231"
+SELECTOR_ALLOWANCE = "0xdd62ed3e"
+
+
+def _word(value):
+    return "0x" + format(value, "064x")
+
+
+class RPCError(Exception):
+    pass
+
+
+class StubChain:
+    """内存中的链状态, 按 JSON-RPC 方法返回结果
+
+    auto_mine 为 True 时广播的 legacy 交易按 nonce 顺序立即上链; 已使用或重复的 nonce 被拒绝,
+    更大的 nonce 进入队列, 等前面的 nonce 到达后一起上链
+    """
+
+    def __init__(self, auto_mine=False) -> None:
+        self.auto_mine = auto_mine
+        self.balances = {}
+        self.nonces = {}
+        self.tokens = {}
+        self.allowances = {}
+        self.receipts = {}
+        self.block = 100
+        self.gas_price = 5000000000
+        self.sent = []
+        self.rejected = []
+        self.queued = {}
+        self._lock = threading.Lock()
+
+    def _address(self, word):
+        return "0x" + word[-40:]
+
+    def call(self, method, params):
+        if method == "eth_getBalance":
+            return hex(self.balances.get(params[0].lower(), 0))
+        if method == "eth_getTransactionCount":
+            return hex(self.nonces.get(params[0].lower(), 0))
+        if method == "eth_blockNumber":
+            return hex(self.block)
+        if method == "eth_chainId":
+            return hex(56)
+        if method == "eth_gasPrice":
+            return hex(self.gas_price)
+        if method == "eth_getBlockByNumber":
+            # BSC 区块的 extraData 包含验证者签名, 超过 32 字节
+            return {'number': hex(self.block), 'gasLimit': hex(140000000), 'extraData': "0x" + "ab" * 97}
+        if method == "eth_getTransactionReceipt":
+            return self.receipts.get(params[0].lower())
+        if method == "eth_estimateGas":
+            return hex(500000)
+        if method == "eth_sendRawTransaction":
+            if self.auto_mine:
+                with self._lock:
+                    return self._mine(params[0])
+            self.sent.append(params[0])
+            return "0x" + format(len(self.sent), "064x")
+        if method == "eth_call":
+            data = params[0]['data']
+            args = data[10:]
+            if data.startswith(SELECTOR_BALANCE_OF):
+                return _word(self.tokens.get(self._address(args[:64]).lower(), 0))
+            if data.startswith(SELECTOR_ALLOWANCE):
+                return _word(self.allowances.get(self._address(args[:64]).lower(), 0))
+        raise KeyError(method)
+
+    def _mine(self, raw):
+        sender = Account.recover_transaction(raw).lower()
+        nonce = int.from_bytes(rlp.decode(bytes.fromhex(raw[2:]))[0], "big")
+        queued = self.queued.setdefault(sender, {})
+        if nonce < self.nonces.get(sender, 0) or nonce in queued:
+            self.rejected.append((sender, nonce))
+            raise RPCError(f"nonce too low: have {self.nonces.get(sender, 0)}, got {nonce}")
+        queued[nonce] = raw
+        while self.nonces.get(sender, 0) in queued:
+            self._include(sender, queued.pop(self.nonces.get(sender, 0)))
+        return "0x" + keccak(hexstr=raw).hex()
+
+    def _include(self, sender, raw):
+        self.nonces[sender] = self.nonces.get(sender, 0) + 1
+        self.sent.append(raw)
+        self.block += 1
+        tx_hash = "0x" + keccak(hexstr=raw).hex()
+        self.receipts[tx_hash] = {
+            'transactionHash': tx_hash,
+            'blockHash': "0x" + format(self.block, "064x"),
+            'blockNumber': hex(self.block),
+            'transactionIndex': "0x0",
+            'from': sender,
+            'to': None,
+            'contractAddress': None,
+            'cumulativeGasUsed': hex(300000),
+            'gasUsed': hex(300000),
+            'effectiveGasPrice': hex(self.gas_price),
+            'logs': [],
+            'logsBloom': "0x" + "00" * 256,
+            'status': "0x1"
+        }
+
+
+class StubRPCServer:
+    """本地 JSON-RPC HTTP 桩节点, 支持单个和 batch 请求
+
+    delay 为每个请求的延迟秒数, status 不为 200 时所有请求返回该 HTTP 状态码,
+    max_rate 大于 0 时每秒超过 max_rate 个请求返回 HTTP 429
+    """
+
+    def __init__(self, chain=None, delay=0, status=200, max_rate=0) -> None:
+        self.chain = chain or StubChain()
+        self.delay = delay
+        self.status = status
+        self.max_rate = max_rate
+        self.requests = 0
+        self.throttled = 0
+        self._window = []
+        self._lock = threading.Lock()
+        self.httpd = ThreadingHTTPServer(("127.0.0.1", 0), self._handler())
+        self.httpd.daemon_threads = True
+        self._thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+
+    @property
+    def uri(self):
+        return f"http://127.0.0.1:{self.httpd.server_address[1]}/"
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *args):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def _limited(self):
+        if not self.max_rate:
+            return False
+        with self._lock:
+            now = time.monotonic()
+            self._window = [t for t in self._window if now - t < 1]
+            if len(self._window) >= self.max_rate:
+                self.throttled += 1
+                return True
+            self._window.append(now)
+            return False
+
+    def _answer(self, item):
+        try:
+            return {'jsonrpc': "2.0", 'id': item.get('id'), 'result': self.chain.call(item['method'], item.get('params', []))}
+        except KeyError:
+            return {'jsonrpc': "2.0", 'id': item.get('id'), 'error': {'code': -32601, 'message': f"method not found: {item['method']}"}}
+        except RPCError as e:
+            return {'jsonrpc': "2.0", 'id': item.get('id'), 'error': {'code': -32000, 'message': str(e)}}
+
+    def _handler(self):
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+
+            def log_message(self, *args):
+                pass
+
+            def do_POST(self):
+                body = json.loads(self.rfile.read(int(self.headers['Content-Length'])))
+                with stub._lock:
+                    stub.requests += 1
+                if stub.delay:
+                    time.sleep(stub.delay)
+                if stub.status != 200 or stub._limited():
+                    self.send_response(stub.status if stub.status != 200 else 429)
+                    self.end_headers()
+                    return
+                response = [stub._answer(item) for item in body] if isinstance(body, list) else stub._answer(body)
+                data = json.dumps(response).encode()
+                self.send_response(200)
+                self.send_header('Content-Type', "application/json")
+                self.send_header('Content-Length', str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+        return Handler
@@ -0,0 +1,38 @@
+import asyncio
+
+from create_account.contracts import encode_call
+
+
+def test_batch_size_capped_by_calldata(make_server):
+    server = make_server(per_request=5000)
+    size = asyncio.run(server._batch_size(None, None, None, "BNB", 0))
+    addresses = [f"0x{i:040x}" for i in range(size)]
+    data = bytes.fromhex(encode_call("multi_send_token", addresses[0], addresses, [10**18] * size)[2:])
+    assert len(data) <= 120000 < len(data) + 64
+    assert asyncio.run(make_server(per_request=5000, max_batch_size=300)._batch_size(None, None, None, "BNB", 0)) == 300
+
+
+def test_estimated_gas_has_margin(make_server):
+    server = make_server(auto_batch=True, gas_margin=1.25)
+    sent = []
+
+    async def estimate(*args):
+        return 1000001
+
+    async def multi_send(token, addresses, amounts, symbol, gas, *args):
+        sent.append(gas)
+
+    async def commit(*args):
+        pass
+
+    server._estimate_multi_send = estimate
+    server.multi_send = multi_send
+    server._commit_transfer = commit
+    asyncio.run(server._distribute_batch([], None, None, ["0x01"], [1], "BNB", []))
+    assert sent == [1250002]
+
+
+def test_shard_limits_cover_account_count(server):
+    for limit, count in ((500, 3), (60, 2), (7, 4), (2, 3)):
+        limits = [server._shard_limit(limit, (count, remainder)) for remainder in range(count)]
+        assert limits == [len([id for id in range(1, limit + 1) if id % count == remainder]) for remainder in range(count)]
@@ -0,0 +1,78 @@
+import asyncio
+
+import pytest
+
+from create_account.confirm import ConfirmationTracker
+
+
+class FlakyReader:
+    """前 failures 次读取抛出 502, 之后 mined 中的交易在 block 区块上链"""
+
+    def __init__(self, failures=0) -> None:
+        self.failures = failures
+        self.block = 100
+        self.mined = {}
+        self.block_reads = []
+
+    def _check(self):
+        if self.failures:
+            self.failures -= 1
+            raise Exception("502 Server Error: Bad Gateway")
+
+    async def block_number(self):
+        self._check()
+        self.block += 1
+        return self.block
+
+    async def block_transactions(self, numbers):
+        self._check()
+        self.block_reads.extend(numbers)
+        return [[h for h, block in self.mined.items() if block == number] for number in numbers]
+
+    async def receipts(self, tx_hashes):
+        self._check()
+        return [{'transactionHash': h, 'status': 1, 'blockNumber': self.mined[h]} if h in self.mined else None for h in tx_hashes]
+
+
+def test_transient_poll_errors_do_not_fail_waiters():
+    reader = FlakyReader(failures=3)
+    tracker = ConfirmationTracker(reader, timeout=5, poll_interval=0.001)
+
+    async def run():
+        reader.mined["0xaa"] = 101
+        return await asyncio.gather(tracker.wait("0xaa"), tracker.wait("0xbb"), return_exceptions=True)
+
+    async def run_with_second_mined():
+        waiting = asyncio.ensure_future(run())
+        await asyncio.sleep(0.05)
+        reader.mined["0xbb"] = reader.block + 1
+        return await waiting
+
+    aa, bb = asyncio.run(run_with_second_mined())
+    assert aa['transactionHash'] == "0xaa"
+    assert bb['transactionHash'] == "0xbb"
+    assert tracker.errors == 0
+
+
+def test_outage_fails_only_after_timeout():
+    reader = FlakyReader(failures=10**6)
+    tracker = ConfirmationTracker(reader, timeout=0.05, poll_interval=0.001, max_backoff=0.01)
+    with pytest.raises(Exception, match="not in the chain"):
+        asyncio.run(tracker.wait("0xaa"))
+
+
+def test_idle_tracker_restarts_from_head():
+    reader = FlakyReader()
+    tracker = ConfirmationTracker(reader, poll_interval=0.001)
+
+    async def run():
+        reader.mined["0xaa"] = 101
+        await tracker.wait("0xaa")
+        assert tracker._next_block is None
+        reader.block += 1000
+        reader.block_reads.clear()
+        reader.mined["0xbb"] = reader.block + 1
+        await tracker.wait("0xbb")
+
+    asyncio.run(run())
+    assert len(reader.block_reads) < 10
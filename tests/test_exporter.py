@@ -0,0 +1,43 @@
+import gzip
+import json
+
+from create_account.database.keys import Keys
+
+
+def insert_keys(server, count):
+    docs = []
+    for i in range(1, count + 1):
+        doc = server._key_doc(i, f"0x{i:040x}", "0x" + format(i, "064x"))
+        doc.update({'isTransfer': i % 3, 'transferred': ["BNB", "PNUT"][:i % 3], 'isMortgage': i % 2 == 0})
+        docs.append(doc)
+    Keys._get_collection().insert_many(docs)
+    return docs
+
+
+def test_ndjson_round_trip_selected_fields(server, tmp_path):
+    insert_keys(server, 9)
+    path = str(tmp_path / "keys.ndjson")
+    server.export_data(path, fields=["_id", "address", "isTransfer"], is_transfer=1)
+    with open(path) as file:
+        docs = [json.loads(line) for line in file]
+    assert docs == [{'_id': i, 'address': f"0x{i:040x}", 'isTransfer': 1} for i in (1, 4, 7)]
+    Keys.drop_collection()
+    server.import_data(path)
+    assert list(Keys._get_collection().find().sort('_id', 1)) == docs
+    # 计数器按导入的最大 id 续接
+    assert Keys.allocate_ids(1) == 8
+
+
+def test_csv_gz_round_trip(server, tmp_path):
+    expected = [doc for doc in insert_keys(server, 9) if doc['isMortgage'] and doc['isTransfer'] == 2]
+    path = str(tmp_path / "keys.csv.gz")
+    server.export_data(path, is_transfer=2, is_mortgage=True)
+    with gzip.open(path, "rt") as file:
+        assert file.readline().strip() == "_id,address,privateKey,isTransfer,transferred,isMortgage"
+    Keys.drop_collection()
+    server.import_data(path)
+    assert list(Keys._get_collection().find().sort('_id', 1)) == expected
+    assert Keys.allocate_ids(1) == expected[-1]['_id'] + 1
+    # 重复导入时已存在的 id 跳过
+    server.import_data(path)
+    assert Keys.objects.count() == len(expected)
@@ -0,0 +1,55 @@
+import asyncio
+
+from eth_account import Account
+from web3 import Web3
+
+from create_account.database.journal import Journal
+from create_account.database.keys import Keys
+from tests.stub_rpc import StubChain, StubRPCServer
+from tests.test_transfer_progress import insert_accounts
+
+KEY = "0x" + "44" * 32
+
+
+def signed(nonce, value=1):
+    tx = {'to': "0x" + "55" * 20, 'value': value, 'gas': 21000, 'gasPrice': 5000000000, 'nonce': nonce, 'chainId': 56}
+    raw = Account.sign_transaction(tx, KEY).rawTransaction
+    return Web3.toHex(raw), Web3.keccak(raw).hex()
+
+
+def journal(nonce, account_id):
+    raw, tx_hash = signed(nonce)
+    sender = Account.from_key(KEY).address
+    Journal(txHash=tx_hash, sender=sender, nonce=nonce, rawTx=raw, phase="transfer", accountIds=[account_id], changes={'transferred': "BNB"}).save()
+    return raw, tx_hash
+
+
+def test_reconcile_journal(make_server):
+    chain = StubChain(auto_mine=True)
+    with StubRPCServer(chain) as stub:
+        server = make_server(chain_rpc=stub.uri, journal=True)
+        insert_accounts(server, 3)
+        # nonce 0: 崩溃前已上链, 进度未提交
+        mined_raw, mined_hash = journal(0, 1)
+        chain.call("eth_sendRawTransaction", [mined_raw])
+        # nonce 1: 未上链, nonce 已被另一笔交易占用
+        replaced_raw, replaced_hash = journal(1, 2)
+        chain.call("eth_sendRawTransaction", [signed(1, value=2)[0]])
+        # nonce 2: 写入日志后未广播
+        pending_raw, pending_hash = journal(2, 3)
+        sent = len(chain.sent)
+        asyncio.run(server.reconcile_journal())
+        # 状态写回前再次崩溃, 重放已上链的日志不会重复计数
+        Journal.objects(txHash=mined_hash).update(set__status="pending")
+        asyncio.run(server.reconcile_journal())
+    assert Journal.objects.get(txHash=mined_hash).status == "done"
+    assert Journal.objects.get(txHash=replaced_hash).status == "failed"
+    assert Journal.objects.get(txHash=pending_hash).status == "done"
+    # 只重新广播了未上链的原交易
+    assert chain.sent[sent:] == [pending_raw]
+    assert replaced_raw not in chain.sent
+    accounts = {account.id: account for account in Keys.objects}
+    assert (accounts[1].isTransfer, accounts[1].transferred) == (1, ["BNB"])
+    assert (accounts[2].isTransfer, accounts[2].transferred) == (0, [])
+    assert (accounts[3].isTransfer, accounts[3].transferred) == (1, ["BNB"])
+    assert not server.unresolved_ids
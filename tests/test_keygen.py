@@ -0,0 +1,26 @@
+from eth_account import Account
+
+from create_account import keygen
+from create_account.database.keys import Keys
+
+# Hardhat / Anvil 默认助记词及其前两个账户
+MNEMONIC = "test test test test test test test test test test test junk"
+ADDRESSES = ["0xf39Fd6e51aad88F6F4ce6aB8827279cffFb92266", "0x70997970C51812dc3A010C7d01b50e0d17dc79C8"]
+PATH = "m/44'/60'/0'/0"
+
+
+def test_known_vector():
+    seed = keygen.hd_seed(MNEMONIC)
+    assert Account.from_key(keygen.derive_key(seed, PATH, 1)).address == ADDRESSES[1]
+    assert keygen.derive_addresses((seed, PATH, 0, 2)) == ADDRESSES
+
+
+def test_account_key_matches_stored_address(make_server):
+    server = make_server(hd_mnemonic=MNEMONIC, account_count=3, generate_workers=1)
+    server.generate_address_bulk()
+    account = Keys.objects.get(id=1)
+    # 数据库中只保存地址, 私钥按 id 派生
+    assert account.address == ADDRESSES[1]
+    assert account.privateKey is None
+    assert Account.from_key(server._account_key(Keys(id=1))).address == account.address
+    assert [account.id for account in Keys.objects.order_by('id')] == [1, 2, 3]
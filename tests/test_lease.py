@@ -0,0 +1,85 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+
+from eth_account import Account
+
+from create_account.database.keys import Keys
+from create_account.database.plan import Plan
+from tests.stub_rpc import StubChain, StubRPCServer
+from tests.test_transfer_progress import insert_accounts
+
+KEYS = ["0x" + "44" * 32, "0x" + "55" * 32]
+WALLETS = [{'address': Account.from_key(key).address, 'key': key} for key in KEYS]
+
+
+def funded_chain():
+    chain = StubChain(auto_mine=True)
+    for wallet in WALLETS:
+        chain.balances[wallet['address'].lower()] = 10**21
+        chain.tokens[wallet['address'].lower()] = 10**24
+        chain.allowances[wallet['address'].lower()] = 2**256 - 1
+    return chain
+
+
+def test_wallets_are_claimed_by_one_worker(make_server):
+    servers = [make_server(work_lease=True, lease_owner=f"worker-{i}", funding_wallets=WALLETS) for i in range(3)]
+    owned = [asyncio.run(server._claim_wallets()) for server in servers]
+    # 分片按全部钱包计算, 与持有的实例无关
+    assert owned == [[(WALLETS[0], (2, 0))], [(WALLETS[1], (2, 1))], []]
+    asyncio.run(servers[0]._release_resources(list(servers[0].resources)))
+    assert asyncio.run(servers[2]._claim_wallets()) == [(WALLETS[0], (2, 0))]
+    assert len(asyncio.run(make_server(work_lease=True, lease_owner="worker-3", funding_wallets=WALLETS, wallets_per_worker=0)._claim_wallets())) == 0
+
+
+def test_heartbeat_keeps_leases(make_server):
+    first = make_server(work_lease=True, lease_seconds=0.6, lease_owner="worker-0")
+    second = make_server(work_lease=True, lease_seconds=0.6, lease_owner="worker-1")
+    accounts = insert_accounts(first, 5)
+
+    async def run():
+        assert len(await first._claim_accounts(accounts, "staking", {})) == 5
+
+        async def steal():
+            await asyncio.sleep(1)
+            return await second._claim_accounts(accounts, "staking", {})
+
+        _, stolen = await asyncio.gather(first._with_leases(asyncio.sleep(1.2)), steal())
+        return stolen
+
+    # 超过租期仍在处理, 心跳续租后其他实例租不到
+    assert asyncio.run(run()) == []
+
+
+def run_workers(make_server, count, **config):
+    with StubRPCServer(funded_chain()) as stub:
+        servers = [
+            make_server(chain_rpc=stub.uri, work_lease=True, lease_owner=f"worker-{i}", funding_wallets=WALLETS, account_count=60, per_request=7, **config)
+            for i in range(count)
+        ]
+        insert_accounts(servers[0], 60)
+
+        async def run():
+            # mongomock 不是线程安全的, 数据库调用在单个线程中执行
+            asyncio.get_running_loop().set_default_executor(ThreadPoolExecutor(1))
+            return await asyncio.gather(*[server._with_leases(server._run_transfer()) for server in servers], return_exceptions=True)
+
+        results = asyncio.run(run())
+        chain = stub.chain
+    assert results == [None] * count
+    # 每个钱包的 nonce 只由一个实例分配, 没有交易因 nonce 冲突被拒绝
+    assert chain.rejected == []
+    assert Keys.objects(transferred__all=["BNB", "PNUT"], isTransfer=2).count() == 60
+    return chain
+
+
+def test_concurrent_workers_distribute_once(make_server):
+    chain = run_workers(make_server, 3)
+    # 2 个钱包各分到 30 个账户, 每币种 7 个一批共 5 批
+    assert len(chain.sent) == 2 * 2 * 5
+
+
+def test_concurrent_workers_compile_plan_once(make_server):
+    chain = run_workers(make_server, 3, distribution_plan=True)
+    assert len(chain.sent) == 2 * 2 * 5
+    for wallet in WALLETS:
+        assert [batch.batch for batch in Plan.objects(wallet=wallet['address'], symbol="PNUT").order_by('batch')] == list(range(5))
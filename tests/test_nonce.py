@@ -0,0 +1,47 @@
+import asyncio
+
+import pytest
+
+from create_account.nonce import NonceManager
+
+
+def test_halt_stops_allocation_until_resync():
+
+    async def fetch(address):
+        return 5
+
+    async def run():
+        manager = NonceManager(fetch, "0x01")
+        first = [await manager.next(), await manager.next()]
+        manager.halt(Exception("send failed"))
+        with pytest.raises(Exception, match="send failed"):
+            await manager.next()
+        manager.resync()
+        return first, await manager.next()
+
+    assert asyncio.run(run()) == ([5, 6], 5)
+
+
+def test_drain_commits_remaining_after_failure(server):
+    wallet = server.wallets[0]['address']
+    committed = []
+
+    async def commit(accounts, symbol, tx_hash=None):
+        committed.append(tx_hash)
+
+    async def confirm(tx_hash):
+        if tx_hash == "0x02":
+            raise Exception("reverted")
+        return tx_hash
+
+    async def run():
+        pending = [(asyncio.ensure_future(confirm(f"0x0{i}")), {'from': wallet}, [], "BNB") for i in range(1, 4)]
+        with pytest.raises(Exception, match="reverted"):
+            await server._drain_pending(pending, 1)
+        assert not pending
+        with pytest.raises(Exception, match="halted"):
+            await server.nonces[wallet].next()
+
+    server._commit_transfer = commit
+    asyncio.run(run())
+    assert committed == ["0x01", "0x03"]
@@ -0,0 +1,50 @@
+import asyncio
+import random
+from unittest import mock
+
+from create_account.database.plan import Plan
+from tests.test_transfer_progress import insert_accounts
+
+
+def test_compile_plan_in_chunks(make_server):
+    server = make_server(per_request=7, plan_chunk=2, plan_seed=42, account_count=20)
+    insert_accounts(server, 20)
+    coins = server.config['distribute'][1:]
+    ranges = [server._amount_range(coin) for coin in coins]
+    with mock.patch.object(server, "_insert_plan", side_effect=server._insert_plan) as insert_plan:
+        asyncio.run(server._compile_plan(coins, ranges, [(server.wallets[0], None)]))
+    # 20 个账户按 7 个一批为 3 批, 每 2 批写入一次
+    assert [len(call.args[0]) for call in insert_plan.call_args_list] == [2, 1]
+    batches = list(Plan.objects.order_by('batch'))
+    assert [len(batch.accountIds) for batch in batches] == [7, 7, 6]
+    assert [id for batch in batches for id in batch.accountIds] == list(range(1, 21))
+    # 分页抽取与一次抽取全部金额结果相同
+    rng = random.Random(f"42:{server.wallets[0]['address']}:PNUT")
+    assert [int(amount) for batch in batches for amount in batch.amounts] == server._draw_amounts(rng, 20, *ranges[0])
+
+
+def test_plan_totals_skip_committed_accounts(make_server):
+    server = make_server(per_request=7, plan_seed=1, account_count=20)
+    accounts = insert_accounts(server, 20)
+    coins = server.config['distribute'][:1]
+    wallets = [server.wallets[0]]
+    asyncio.run(server._compile_plan(coins, [server._amount_range(coin) for coin in coins], [(wallets[0], None)]))
+    amount = int(server._amount_range(coins[0])[0])
+    assert asyncio.run(server._plan_totals(coins, wallets)) == {(wallets[0]['address'], "BNB"): 20 * amount}
+    # 已提交 15 个账户后续跑, 只需为剩余 5 个账户准备资金
+    asyncio.run(server._commit_transfer(accounts[:15], "BNB"))
+    assert asyncio.run(server._plan_totals(coins, wallets)) == {(wallets[0]['address'], "BNB"): 5 * amount}
+
+
+def test_approve_before_compile(make_server):
+    server = make_server(distribution_plan=True, account_count=5)
+    insert_accounts(server, 5)
+    calls = []
+    with mock.patch.object(server, "_check_funding", side_effect=lambda *a: calls.append("funding")), \
+            mock.patch.object(server, "approve", side_effect=lambda *a, **k: calls.append("approve")), \
+            mock.patch.object(server, "_compile_plan", side_effect=lambda *a: calls.append("compile")), \
+            mock.patch.object(server, "_send_plan", side_effect=lambda *a: calls.append("send")):
+        asyncio.run(server._run_transfer())
+    # 按 gas 估算批次大小时 MultiSend 需要已获得代币授权, 编译计划必须在授权之后
+    assert calls.index("compile") > max(i for i, call in enumerate(calls) if call == "approve")
+    assert calls.index("funding") < calls.index("approve")
@@ -0,0 +1,92 @@
+import asyncio
+import json
+from concurrent.futures import ThreadPoolExecutor
+
+import mongomock
+from web3._utils import request
+from web3._utils.caching import generate_cache_key
+
+from create_account import async_server
+from create_account.async_server import AsyncServer
+from create_account.provider import AsyncPooledHTTPProvider, PooledHTTPProvider
+from tests.conftest import make_config
+from tests.stub_rpc import StubRPCServer
+
+BATCH = json.dumps([{'jsonrpc': "2.0", 'id': 0, 'method': "eth_blockNumber", 'params': []}]).encode()
+
+
+def test_reads_route_to_fastest_endpoint():
+    with StubRPCServer(delay=0.2) as slow, StubRPCServer() as fast:
+        provider = PooledHTTPProvider([slow.uri, fast.uri])
+        for _ in range(6):
+            assert provider.make_request("eth_blockNumber", [])['result'] == hex(100)
+    # 两个节点初始延迟相同, 测得延迟后只访问快节点
+    assert slow.requests <= 1
+    assert fast.requests >= 5
+
+
+def test_endpoints_keep_own_sessions():
+    with StubRPCServer() as first, StubRPCServer() as second:
+        provider = PooledHTTPProvider([first.uri, second.uri])
+        with ThreadPoolExecutor(8) as executor:
+            results = list(executor.map(lambda _: json.loads(provider.post(BATCH))[0]['result'], range(32)))
+        provider.close()
+    assert results == [hex(100)] * 32
+    assert provider.endpoints[0].session is not provider.endpoints[1].session
+    # 不经过 web3 按 URI 全局缓存的 session
+    assert generate_cache_key(first.uri) not in request._session_cache
+    assert generate_cache_key(second.uri) not in request._session_cache
+
+
+def test_failing_endpoint_is_evicted():
+    with StubRPCServer(status=500) as failing, StubRPCServer() as good:
+        provider = PooledHTTPProvider([failing.uri, good.uri], max_failures=2)
+        for _ in range(5):
+            assert json.loads(provider.post(BATCH))[0]['result'] == hex(100)
+        assert failing.requests == 2
+        assert provider.endpoints[0].evicted_until > 0
+
+
+def test_throttled_endpoint_fails_over_and_broadcast_reaches_both():
+    with StubRPCServer(status=429) as throttled, StubRPCServer() as good:
+        provider = PooledHTTPProvider([throttled.uri, good.uri])
+        assert provider.make_request("eth_chainId", [])['result'] == hex(56)
+        assert provider.make_request("eth_sendRawTransaction", ["0x01"])['result'] == "0x" + format(1, "064x")
+        assert throttled.requests == 2
+        assert good.chain.sent == ["0x01"]
+
+
+def test_async_pool_fails_over():
+    with StubRPCServer(status=429) as throttled, StubRPCServer(delay=0.2) as slow, StubRPCServer() as fast:
+        provider = AsyncPooledHTTPProvider([throttled.uri, slow.uri, fast.uri], broadcast=3)
+
+        async def run():
+            results = [(await provider.make_request("eth_blockNumber", []))['result'] for _ in range(5)]
+            sent = await provider.make_request("eth_sendRawTransaction", ["0x02"])
+            batch = json.loads(await provider.post(BATCH))
+            await provider.close()
+            return results, sent, batch
+
+        results, sent, batch = asyncio.run(run())
+        assert results == [hex(100)] * 5
+        assert sent['result'] == "0x" + format(1, "064x")
+        assert batch[0]['result'] == hex(100)
+        assert slow.requests <= 2
+        assert fast.chain.sent == slow.chain.sent == ["0x02"]
+
+
+def test_async_server_uses_pool_and_poa(make_server, monkeypatch):
+    monkeypatch.setattr(async_server, "AsyncIOMotorClient", lambda host: mongomock.MongoClient())
+    with StubRPCServer(status=500) as failing, StubRPCServer() as good:
+        config = make_config(chain_rpcs=[failing.uri, good.uri])
+        del config['chain_rpc']
+        server = AsyncServer(config)
+
+        async def run():
+            return await server.reader.block_number(), await server.async_web3.eth.get_block("latest")
+
+        head, block = asyncio.run(server._with_leases(run()))
+        server.logger.logger.handlers.clear()
+    assert head == 100
+    assert block['gasLimit'] == 140000000
+    assert len(block['proofOfAuthorityData']) == 97
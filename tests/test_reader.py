@@ -0,0 +1,50 @@
+import asyncio
+
+import pytest
+
+from tests.stub_rpc import StubRPCServer
+
+TOKEN = "0x705931A83C9b22fB29985f28Aee3337Aa10EFE11"
+SPENDER = "0x25108c0d83Ee16b81f63B49F0F37933cFC8ea0b2"
+
+
+def addresses(count):
+    return [f"0x{i:040x}" for i in range(1, count + 1)]
+
+
+def test_batch_reads_through_stub_node(make_server):
+    with StubRPCServer() as stub:
+        chain = stub.chain
+        for i, address in enumerate(addresses(7)):
+            chain.balances[address] = 10**18 + i
+            chain.nonces[address] = i
+            chain.tokens[address] = 3 * 10**18 * i
+            chain.allowances[address] = i
+        server = make_server(chain_rpc=stub.uri, read_batch_size=3)
+
+        async def read():
+            return await asyncio.gather(server.reader.balances(addresses(7)), server.reader.nonces(addresses(7)),
+                                        server.reader.token_balances(TOKEN, addresses(7)), server.reader.allowances(TOKEN, addresses(7), SPENDER))
+
+        balances, nonces, tokens, allowances = asyncio.run(read())
+        # 7 个地址按 3 个一批, 每种查询 3 个 HTTP 请求
+        assert stub.requests == 12
+    assert balances == [10**18 + i for i in range(7)]
+    assert nonces == list(range(7))
+    assert tokens == [3 * 10**18 * i for i in range(7)]
+    assert allowances == list(range(7))
+
+
+def test_receipts_convert_quantities(make_server):
+    with StubRPCServer() as stub:
+        stub.chain.receipts["0xaa"] = {'transactionHash': "0xaa", 'status': "0x1", 'gasUsed': "0x5208", 'blockNumber': "0x64"}
+        server = make_server(chain_rpc=stub.uri)
+        receipts = asyncio.run(server.reader.receipts(["0xaa", "0xbb"]))
+    assert receipts == [{'transactionHash': "0xaa", 'status': 1, 'gasUsed': 21000, 'blockNumber': 100}, None]
+
+
+def test_batch_error_item_raises(make_server):
+    with StubRPCServer() as stub:
+        server = make_server(chain_rpc=stub.uri)
+        with pytest.raises(Exception, match="eth_unknown"):
+            asyncio.run(server.reader.request([("eth_blockNumber", []), ("eth_unknown", [])]))
@@ -0,0 +1,69 @@
+import asyncio
+
+import pytest
+
+from create_account.confirm import ConfirmationTracker
+from create_account.replace import ReplacementEngine
+from tests.test_confirm import FlakyReader
+
+GWEI = 10**9
+
+
+def forward_tx(**fees):
+    return {'from': "0x01", 'to': "0x02", 'nonce': 7, 'gas': 21000, 'value': 10**15, **fees}
+
+
+def test_sweep_bump_pays_extra_fee_from_value():
+    engine = ReplacementEngine(None, None, 2)
+    tx = forward_tx(gasPrice=5 * GWEI)
+    replacement = engine.bumped(tx, sweep=True)
+    assert replacement['gasPrice'] == 5625000000
+    assert replacement['value'] + replacement['gas'] * replacement['gasPrice'] == tx['value'] + tx['gas'] * tx['gasPrice']
+    assert engine.bumped(tx)['value'] == tx['value']
+    tx = forward_tx(maxFeePerGas=6 * GWEI, maxPriorityFeePerGas=GWEI)
+    replacement = engine.bumped(tx, sweep=True)
+    assert replacement['value'] + replacement['gas'] * replacement['maxFeePerGas'] == tx['value'] + tx['gas'] * tx['maxFeePerGas']
+    assert engine.bumped(forward_tx(gasPrice=5 * GWEI, value=1000), sweep=True) is None
+
+
+def test_replacement_follows_tracker_blocks():
+    reader = FlakyReader()
+    tracker = ConfirmationTracker(reader, timeout=5, poll_interval=0.001)
+    sent = []
+
+    async def resend(tx, key, journal=None):
+        sent.append(tx)
+        reader.mined["0xbb"] = reader.block + 2
+        return "0xbb"
+
+    engine = ReplacementEngine(reader, resend, after_blocks=3, timeout=5, tracker=tracker)
+
+    async def run():
+        engine.track("0xaa", forward_tx(gasPrice=5 * GWEI), "key", sweep=True)
+        return await engine.wait("0xaa")
+
+    mined, receipt, hashes = asyncio.run(run())
+    assert (mined, hashes) == ("0xbb", ["0xaa", "0xbb"])
+    assert receipt['transactionHash'] == "0xbb"
+    assert len(sent) == 1 and sent[0]['gasPrice'] == 5625000000
+    assert not tracker.pending
+
+
+def test_insufficient_funds_stops_bumping():
+    reader = FlakyReader()
+    tracker = ConfirmationTracker(reader, timeout=5, poll_interval=0.001)
+    attempts = []
+
+    async def resend(tx, key, journal=None):
+        attempts.append(tx)
+        raise Exception("insufficient funds for gas * price + value")
+
+    engine = ReplacementEngine(reader, resend, after_blocks=1, timeout=0.2, tracker=tracker)
+
+    async def run():
+        engine.track("0xaa", forward_tx(gasPrice=5 * GWEI), "key")
+        return await engine.wait("0xaa")
+
+    with pytest.raises(Exception, match="insufficient funds"):
+        asyncio.run(run())
+    assert len(attempts) == 1
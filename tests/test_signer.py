@@ -0,0 +1,44 @@
+from eth_account import Account
+
+from create_account.signer import BulkSigner
+
+KEYS = ["0x" + format(i, "064x") for i in range(1, 4)]
+
+
+def transaction(key, nonce, gas_price=5000000000):
+    return {
+        'from': Account.from_key(key).address,
+        'to': "0x25108c0d83Ee16b81f63B49F0F37933cFC8ea0b2",
+        'value': 10**15,
+        'gas': 21000,
+        'gasPrice': gas_price,
+        'nonce': nonce,
+        'chainId': 56
+    }
+
+
+def test_bulk_signer_matches_inline_signing():
+    items = [(transaction(key, nonce), key) for key in KEYS for nonce in range(2)]
+    signer = BulkSigner(workers=2, chunk=4)
+    try:
+        raws, speed = signer.sign(items)
+    finally:
+        signer.close()
+    # 分块在子进程中签名, 结果与逐笔签名一致且顺序不变
+    assert raws == [bytes(Account.sign_transaction(tx, key).rawTransaction) for tx, key in items]
+    assert speed > 0
+
+
+def test_take_only_identical_transaction():
+    signer = BulkSigner(workers=1)
+    items = [(transaction(KEYS[0], 0), KEYS[0]), (transaction(KEYS[0], 1), KEYS[0])]
+    try:
+        raws, _ = signer.sign(items)
+        assert signer.take(transaction(KEYS[0], 0)) == raws[0]
+        # 预签名结果只使用一次
+        assert signer.take(transaction(KEYS[0], 0)) is None
+        # 手续费变化后 (from, nonce) 相同也不使用缓存
+        assert signer.take(transaction(KEYS[0], 1, gas_price=6000000000)) is None
+        assert signer.take(transaction(KEYS[1], 0)) is None
+    finally:
+        signer.close()
@@ -0,0 +1,99 @@
+import asyncio
+
+from eth_account import Account
+
+from create_account.database.keys import Keys
+from tests.stub_rpc import StubChain, StubRPCServer
+
+KEY = "0x" + "33" * 32
+
+
+def sent_hash(n):
+    return "0x" + format(n, "064x")
+
+
+def receipt(n, status):
+    return {'transactionHash': sent_hash(n), 'status': hex(status), 'gasUsed': hex(30000), 'blockNumber': "0x64"}
+
+
+def run_chain(make_server, deposit_status):
+    address = Account.from_key(KEY).address
+    with StubRPCServer() as stub:
+        # 第 1 笔为 approve, 第 2 笔为 deposit
+        stub.chain.receipts[sent_hash(1)] = receipt(1, 1)
+        stub.chain.receipts[sent_hash(2)] = receipt(2, deposit_status)
+        server = make_server(chain_rpc=stub.uri, staking_chain=True)
+        Keys._get_collection().insert_one({**server._key_doc(1, address), 'privateKey': KEY})
+        account = Keys.objects.get(id=1)
+        calls = []
+
+        async def send_next(account, balance=None, nonce=None, to=None):
+            calls.append(("forward", balance, nonce))
+
+        async def staking(account):
+            calls.append(("fallback", ))
+
+        server._send_next = send_next
+        server._staking = staking
+        state = {'token': 5 * 10**18, 'allowance': 0, 'balance': 10**16, 'nonce': 7}
+        asyncio.run(server._staking_chain(account, state))
+        sent = len(stub.chain.sent)
+    return server, calls, sent
+
+
+def test_reverted_deposit_does_not_forward(make_server):
+    _, calls, sent = run_chain(make_server, 0)
+    # 只广播了 approve 和 deposit, 余额留给逐笔回退支付手续费
+    assert sent == 2
+    assert calls == [("fallback", )]
+    assert not Keys.objects.get(id=1).isMortgage
+
+
+def test_forward_after_confirmed_deposit(make_server):
+    _, calls, sent = run_chain(make_server, 1)
+    paid = 2 * 30000 * 5000000000
+    assert sent == 2
+    assert calls == [("forward", 10**16 - paid, 9)]
+    assert Keys.objects.get(id=1).isMortgage
+
+
+def test_failed_page_read_is_retried(make_server, tmp_path):
+    server = make_server()
+    Keys._get_collection().insert_many([{**server._key_doc(i, f"0x{i:040x}"), 'isTransfer': 2} for i in range(1, 4)])
+    reads = []
+    staked = []
+
+    async def read_staking_state(accounts):
+        reads.append(len(accounts))
+        if len(reads) == 1:
+            raise Exception("429 Client Error: Too Many Requests")
+        return {account.id: {} for account in accounts}
+
+    async def staking(account, state=None):
+        staked.append(account.id)
+        await server._update_accounts([account.id], isMortgage=True)
+
+    server._read_staking_state = read_staking_state
+    server._staking = staking
+    asyncio.run(server._run_staking())
+    assert reads == [3, 3]
+    assert staked == [1, 2, 3]
+    assert "Too Many Requests" in (tmp_path / "logs" / "create_error.log").read_text()
+
+
+def test_staking_on_zero_gas_price_chain(make_server):
+    address = Account.from_key(KEY).address
+    chain = StubChain(auto_mine=True)
+    chain.gas_price = 0
+    chain.balances[address.lower()] = 10**16
+    chain.tokens[address.lower()] = 5 * 10**18
+    with StubRPCServer(chain) as stub:
+        fees = {"fee_transfer": 0, "gas_price": 0, "gas_transfer": 21000, "gas_approve": 44284, "gas_deposit": 234482}
+        server = make_server(chain_rpc=stub.uri, fees=fees)
+        Keys._get_collection().insert_one({**server._key_doc(1, address, KEY), 'isTransfer': 2})
+        asyncio.run(server._staking(Keys.objects.get(id=1)))
+    # approve 未付手续费也占用 nonce 0, deposit 和转发依次使用 1 和 2
+    assert chain.rejected == []
+    assert len(chain.sent) == 3
+    assert chain.nonces[address.lower()] == 3
+    assert Keys.objects.get(id=1).isMortgage
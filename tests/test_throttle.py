@@ -0,0 +1,52 @@
+import asyncio
+import time
+
+from eth_account import Account
+
+from create_account.throttle import AdaptiveThrottle
+from tests.stub_rpc import StubRPCServer
+
+KEY = "0x" + "22" * 32
+
+
+def test_throttle_settles_below_node_rate_limit(make_server):
+    sender = Account.from_key(KEY).address
+    with StubRPCServer(max_rate=10) as stub:
+        server = make_server(chain_rpc=stub.uri, adaptive_throttle=True, post_interval=0.02, throttle_max_interval=0.3)
+
+        async def run(seconds):
+            accepted = 0
+            nonce = 0
+            start = time.monotonic()
+            while time.monotonic() - start < seconds:
+                tx = {'chainId': 56, 'from': sender, 'to': sender, 'data': b"", 'value': 0, 'gas': 21000, 'gasPrice': 5000000000, 'nonce': nonce}
+                try:
+                    await server._sign_and_send(tx, KEY)
+                except Exception:
+                    continue
+                accepted += 1
+                nonce += 1
+            return accepted
+
+        asyncio.run(run(1))
+        throttled = stub.throttled
+        accepted = asyncio.run(run(3))
+        late_throttled = stub.throttled - throttled
+    # 起步 50 req/s 超过节点限流, 退避后稳定在 10 req/s 以下且很少再被限流
+    assert throttled > 0
+    assert server.throttle.backoffs > 0
+    assert 15 <= accepted <= 33
+    assert late_throttled <= accepted // 3
+
+
+def test_throttle_interval_bounds():
+    throttle = AdaptiveThrottle(1, max_rate=20, max_interval=4, target_latency=6)
+    for _ in range(100):
+        throttle.accepted()
+    assert throttle.interval == 1 / 20
+    for _ in range(10):
+        throttle.observe_error(Exception("429 Client Error: Too Many Requests"))
+    assert throttle.interval == 4
+    assert not throttle.observe_error(Exception("execution reverted"))
+    throttle.included(10)
+    assert throttle.backoffs == 11
@@ -0,0 +1,28 @@
+import asyncio
+from unittest import mock
+
+from mongomock.collection import Collection
+
+from create_account.database.keys import Keys
+
+
+def insert_accounts(server, count):
+    Keys._get_collection().insert_many([server._key_doc(i, f"0x{i:040x}") for i in range(1, count + 1)])
+    return list(Keys.objects.only('id', 'address').order_by('id'))
+
+
+def test_commit_transfer_is_one_update_per_batch(server):
+    accounts = insert_accounts(server, 200)
+    with mock.patch.object(Collection, "update_many", autospec=True, side_effect=Collection.update_many) as update_many:
+        asyncio.run(server._commit_transfer(accounts, "BNB"))
+    assert update_many.call_count == 1
+    assert Keys.objects(isTransfer=1, transferred="BNB").count() == 200
+
+
+def test_replayed_commit_does_not_count_twice(server):
+    accounts = insert_accounts(server, 10)
+    asyncio.run(server._commit_transfer(accounts, "BNB"))
+    asyncio.run(server._commit_transfer(accounts, "BNB"))
+    asyncio.run(server._commit_transfer(accounts[:5], "PNUT"))
+    assert Keys.objects(isTransfer=1, transferred=["BNB"]).count() == 5
+    assert Keys.objects(isTransfer=2, transferred=["BNB", "PNUT"]).count() == 5